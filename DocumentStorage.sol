@@ -3,8 +3,11 @@ pragma solidity ^0.8.0;
 
 contract DocumentStorage {
     mapping(string => bool) private storedHashes; 
+    // Gốc Merkle của một lô tài liệu -> số tài liệu trong lô
+    mapping(bytes32 => uint256) private merkleRoots;
 
     event DocumentStored(string documentHash);
+    event MerkleRootStored(bytes32 merkleRoot, uint256 documentCount);
 
     function storeDocument(string memory documentHash) public {
         require(!storedHashes[documentHash], "Document already exists!");
@@ -12,7 +15,41 @@ contract DocumentStorage {
         emit DocumentStored(documentHash);
     }
 
+    // Lưu nhiều hash trong một giao dịch; hash đã tồn tại được bỏ qua để cả lô không bị revert
+    function storeDocuments(string[] memory documentHashes) public {
+        for (uint i = 0; i < documentHashes.length; i++) {
+            if (!storedHashes[documentHashes[i]]) {
+                storedHashes[documentHashes[i]] = true;
+                emit DocumentStored(documentHashes[i]);
+            }
+        }
+    }
+
     function verifyDocument(string memory documentHash) public view returns (bool) {
         return storedHashes[documentHash];
     }
+
+    function storeMerkleRoot(bytes32 merkleRoot, uint256 documentCount) public {
+        require(documentCount > 0, "Empty batch!");
+        require(merkleRoots[merkleRoot] == 0, "Merkle root already exists!");
+        merkleRoots[merkleRoot] = documentCount;
+        emit MerkleRootStored(merkleRoot, documentCount);
+    }
+
+    function verifyMerkleRoot(bytes32 merkleRoot) public view returns (bool) {
+        return merkleRoots[merkleRoot] > 0;
+    }
+
+    // Giống merkle.py phía server: lá = sha256(0x00 || documentHash), node = sha256(0x01 || min || max).
+    // Tiền tố khác nhau để một tài liệu 64 byte ghép từ hai hash con không thể khớp với node trong
+    function verifyDocumentProof(bytes32 documentHash, bytes32[] memory proof, bytes32 merkleRoot) public view returns (bool) {
+        bytes32 computed = sha256(abi.encodePacked(bytes1(0x00), documentHash));
+        for (uint i = 0; i < proof.length; i++) {
+            bytes32 sibling = proof[i];
+            computed = computed <= sibling
+                ? sha256(abi.encodePacked(bytes1(0x01), computed, sibling))
+                : sha256(abi.encodePacked(bytes1(0x01), sibling, computed));
+        }
+        return computed == merkleRoot && merkleRoots[merkleRoot] > 0;
+    }
 }
@@ -1,22 +1,26 @@
-from flask import Flask, jsonify, request
-import requests
+from flask import Flask, jsonify, request, Response, stream_with_context, send_file
 import os
 import hashlib
 import json
 import time
 from blockchain import Blockchain
 from web3 import Web3
-from eth_account import Account
-from p2p import NodeRegistry
+from p2p import NodeRegistry, PeerBroadcaster, PeerSessionPool
+from similarity_index import ContentSimilarityIndex
+from chain_sync import ChainSyncService
+from chain_store import ChainStore
+from miner import ProofOfWorkMiner
+from block_producer import BlockProducer
 import sys
 import socket
-import pdfplumber
-from docx import Document
-import io
-from datasketch import MinHash
-from eth_abi import decode
-import re
-import unicodedata
+from document_analysis import AnalyzedDocument, CONTENT_HASH_VERSION, content_hash_version
+from extraction_cache import ExtractionCache
+from upload_spool import UploadSpool
+from node_identity import NodeIdentity, verify_attestation
+from eth_anchor import EthereumAnchorService
+from merkle_anchor import MerkleBatchAnchor
+from eth_log_indexer import EthereumLogIndexer
+from eth_verifier import EthereumBatchVerifier
 from flask_cors import CORS
 
 def get_local_ip():
@@ -31,16 +35,26 @@ def get_local_ip():
     return ip
 
 bootstrap_url = "http://192.168.1.8:5000"
-node_registry = NodeRegistry(bootstrap_url=bootstrap_url)
+
+# Pool kết nối keep-alive dùng chung cho mọi request giữa các node
+PEER_POOL_SIZE = 10
+PEER_TIMEOUT = 10
+peer_sessions = PeerSessionPool(pool_size=PEER_POOL_SIZE, timeout=PEER_TIMEOUT)
+
+node_registry = NodeRegistry(bootstrap_url=bootstrap_url, sessions=peer_sessions)
 
 # Kết nối với Ganache
 web3 = Web3(Web3.HTTPProvider("http://127.0.0.1:8545"))
 
+# Phiên bản contract: 1 = DocumentStorage (khóa string hex), 2 = DocumentStorageV2 (khóa bytes32,
+# có verifyDocuments). Đổi sang 2 thì cập nhật contract_address theo địa chỉ deploy_contract.py v2 in ra
+CONTRACT_VERSION = 1
+
 # Địa chỉ contract
 contract_address = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
 
-# ABI của smart contract
-contract_abi = [
+# ABI của smart contract, khớp với compiled_abi.json/compiled_bytecode.json mà deploy_contract.py v1 deploy
+contract_abi_v1 = [
     {
         "anonymous": False,
         "inputs": [{"indexed": False, "internalType": "string", "name": "documentHash", "type": "string"}],
@@ -63,6 +77,145 @@ contract_abi = [
     }
 ]
 
+# storeDocuments và các hàm Merkle đã có trong DocumentStorage.sol nhưng file biên dịch trong repo vẫn là
+# bản cũ. Chạy compilesc.py, deploy lại bằng deploy_contract.py v1 rồi mới đặt CONTRACT_V1_EXTENDED = True
+CONTRACT_V1_EXTENDED = False
+contract_abi_v1_extensions = [
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": False, "internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"},
+            {"indexed": False, "internalType": "uint256", "name": "documentCount", "type": "uint256"}
+        ],
+        "name": "MerkleRootStored",
+        "type": "event"
+    },
+    {
+        "inputs": [{"internalType": "string[]", "name": "documentHashes", "type": "string[]"}],
+        "name": "storeDocuments",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"},
+            {"internalType": "uint256", "name": "documentCount", "type": "uint256"}
+        ],
+        "name": "storeMerkleRoot",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"}],
+        "name": "verifyMerkleRoot",
+        "outputs": [{"internalType": "bool", "name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"internalType": "bytes32", "name": "documentHash", "type": "bytes32"},
+            {"internalType": "bytes32[]", "name": "proof", "type": "bytes32[]"},
+            {"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"}
+        ],
+        "name": "verifyDocumentProof",
+        "outputs": [{"internalType": "bool", "name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+if CONTRACT_V1_EXTENDED:
+    contract_abi_v1 = contract_abi_v1 + contract_abi_v1_extensions
+
+contract_abi_v2 = [
+    {
+        "anonymous": False,
+        "inputs": [{"indexed": False, "internalType": "bytes32", "name": "documentHash", "type": "bytes32"}],
+        "name": "DocumentStored",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": False, "internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"},
+            {"indexed": False, "internalType": "uint256", "name": "documentCount", "type": "uint256"}
+        ],
+        "name": "MerkleRootStored",
+        "type": "event"
+    },
+    {
+        "inputs": [{"internalType": "bytes32", "name": "documentHash", "type": "bytes32"}],
+        "name": "storeDocument",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "bytes32[]", "name": "documentHashes", "type": "bytes32[]"}],
+        "name": "storeDocuments",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "bytes32", "name": "documentHash", "type": "bytes32"}],
+        "name": "verifyDocument",
+        "outputs": [{"internalType": "bool", "name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "bytes32[]", "name": "documentHashes", "type": "bytes32[]"}],
+        "name": "verifyDocuments",
+        "outputs": [{"internalType": "bool[]", "name": "", "type": "bool[]"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"},
+            {"internalType": "uint256", "name": "documentCount", "type": "uint256"}
+        ],
+        "name": "storeMerkleRoot",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"}],
+        "name": "verifyMerkleRoot",
+        "outputs": [{"internalType": "bool", "name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"internalType": "bytes32", "name": "documentHash", "type": "bytes32"},
+            {"internalType": "bytes32[]", "name": "proof", "type": "bytes32[]"},
+            {"internalType": "bytes32", "name": "merkleRoot", "type": "bytes32"}
+        ],
+        "name": "verifyDocumentProof",
+        "outputs": [{"internalType": "bool", "name": "", "type": "bool"}],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+CONTRACT_ABIS = {1: contract_abi_v1, 2: contract_abi_v2}
+contract_abi = CONTRACT_ABIS[CONTRACT_VERSION]
+# Kiểu ABI của document_hash trong hàm và sự kiện DocumentStored
+DOCUMENT_HASH_ABI_TYPE = 'bytes32' if CONTRACT_VERSION == 2 else 'string'
+
+def contract_document_key(document_hash):
+    """Tham số document_hash cho contract: chuỗi hex (v1) hoặc 32 byte (v2)."""
+    return bytes.fromhex(document_hash) if CONTRACT_VERSION == 2 else document_hash
+
+def contract_supports(function_name):
+    """Contract đang dùng có hàm function_name hay không (theo ABI của bản đã deploy)."""
+    return any(entry['type'] == 'function' and entry['name'] == function_name for entry in contract_abi)
+
 # Load contract
 contract = web3.eth.contract(address=contract_address, abi=contract_abi)
 
@@ -71,38 +224,119 @@ if web3.is_connected():
 else:
     print("❌ Không thể kết nối với Ethereum node!")
 
+# Gửi giao dịch Ethereum qua hàng đợi nền: nonce cấp cục bộ, receipt thu thập ở luồng riêng.
+# ETH_ANCHOR_MAX_BATCH > 1 gom nhiều hash vào một lần gọi storeDocuments (cần contract có hàm này)
+ETH_CHAIN_ID = 31337
+ETH_ANCHOR_MAX_BATCH = 1
+ETH_ANCHOR_MAX_WAIT = 2
+# Job đã xong được giữ trong bộ nhớ chừng này giây cho /ethereum_status rồi bị xóa
+ETH_ANCHOR_JOB_RETENTION = 3600
+if ETH_ANCHOR_MAX_BATCH > 1 and not contract_supports('storeDocuments'):
+    print("Contract chưa có storeDocuments, mỗi giao dịch Ethereum chỉ lưu một hash")
+    ETH_ANCHOR_MAX_BATCH = 1
+anchor_service = EthereumAnchorService(
+    web3, contract, chain_id=ETH_CHAIN_ID, max_batch=ETH_ANCHOR_MAX_BATCH, max_wait=ETH_ANCHOR_MAX_WAIT,
+    encode_hash=contract_document_key, job_retention=ETH_ANCHOR_JOB_RETENTION
+)
+
+# Xác minh trên contract theo lô: v2 dùng verifyDocuments, v1 gộp verifyDocument vào một JSON-RPC batch.
+# Kết quả dương được cache trong ETH_VERIFY_POSITIVE_TTL giây
+ETH_VERIFY_CHUNK_SIZE = 500
+ETH_VERIFY_POSITIVE_TTL = 300
+eth_verifier = EthereumBatchVerifier(
+    web3, contract, encode_hash=contract_document_key, batch_view=CONTRACT_VERSION == 2,
+    chunk_size=ETH_VERIFY_CHUNK_SIZE, positive_ttl=ETH_VERIFY_POSITIVE_TTL
+)
+
 app = Flask(__name__)
 CORS(app)
-blockchain = Blockchain()
+# Mỗi node (theo cổng) lưu chuỗi vào một file SQLite riêng
+NODE_PORT = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 5000
+CHAIN_DATA_FOLDER = 'chain_data'
+chain_store = ChainStore(os.path.join(CHAIN_DATA_FOLDER, f'chain_{NODE_PORT}.db'))
+# Khóa ký của node, dùng để ký xác nhận gửi kèm document_hash/content_hash cho các peer
+node_identity = NodeIdentity(os.path.join(CHAIN_DATA_FOLDER, f'node_{NODE_PORT}.key'))
+# Lô Merkle: nhiều tài liệu chung một giao dịch storeMerkleRoot, ký bằng tài khoản của node
+ETH_ANCHOR_PRIVATE_KEY = os.environ.get('ETH_ANCHOR_PRIVATE_KEY')
+if ETH_ANCHOR_PRIVATE_KEY and not contract_supports('storeMerkleRoot'):
+    print("Contract chưa có storeMerkleRoot, tắt lô Merkle")
+    ETH_ANCHOR_PRIVATE_KEY = None
+MERKLE_BATCH_SIZE = 1000
+MERKLE_MAX_WAIT = 60
+merkle_anchor = MerkleBatchAnchor(
+    os.path.join(CHAIN_DATA_FOLDER, f'merkle_{NODE_PORT}.db'), anchor_service, ETH_ANCHOR_PRIVATE_KEY,
+    contract=contract, batch_size=MERKLE_BATCH_SIZE, max_wait=MERKLE_MAX_WAIT
+)
+# Chỉ mục cục bộ các sự kiện DocumentStored, đọc dần theo từng khoảng block ở luồng nền
+ETH_INDEX_INTERVAL = 5
+ETH_INDEX_RANGE_SIZE = 2000
+eth_log_indexer = EthereumLogIndexer(
+    web3, contract_address, DOCUMENT_HASH_ABI_TYPE, os.path.join(CHAIN_DATA_FOLDER, f'eth_index_{NODE_PORT}.db'),
+    range_size=ETH_INDEX_RANGE_SIZE, interval=ETH_INDEX_INTERVAL
+)
+# Đào song song trên nhiều tiến trình; độ khó phải giống nhau trên mọi node
+MINING_DIFFICULTY = 4
+MINER_WORKERS = os.cpu_count()
+miner = ProofOfWorkMiner(workers=MINER_WORKERS)
+# Giao dịch từ peer chưa được đào sau khoảng này (node gốc đã dừng) thì không còn chặn trùng lặp
+PENDING_TRANSACTION_TTL = 600
+blockchain = Blockchain(
+    sessions=peer_sessions, store=chain_store, miner=miner, difficulty=MINING_DIFFICULTY,
+    pending_ttl=PENDING_TRANSACTION_TTL
+)
+# Ma trận chữ ký MinHash cho content_hash, tự cập nhật khi thêm block hoặc thay chuỗi
+similarity_index = ContentSimilarityIndex()
+SIMILARITY_TOP_K = 5
+blockchain.add_listener(similarity_index)
+# Đồng bộ chuỗi ở luồng nền thay vì gọi replace_chain() trong mỗi request
+CHAIN_SYNC_INTERVAL = 15
+chain_sync = ChainSyncService(blockchain, node_registry, peer_sessions, interval=CHAIN_SYNC_INTERVAL)
 
 # Đảm bảo thư mục lưu trữ file
 UPLOAD_FOLDER = 'Uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Cache kết quả trích xuất theo SHA-256, tầng đĩa nằm trong UPLOAD_FOLDER
+EXTRACTION_CACHE_SIZE = 256
+EXTRACTION_CACHE_DIR = os.path.join(UPLOAD_FOLDER, 'extraction_cache')
+EXTRACTION_CACHE_DISK_BYTES = 256 * 1024 * 1024
+extraction_cache = ExtractionCache(
+    max_entries=EXTRACTION_CACHE_SIZE,
+    disk_dir=EXTRACTION_CACHE_DIR,
+    max_disk_bytes=EXTRACTION_CACHE_DISK_BYTES
+)
+
+# File tải lên được ghi tạm ra đĩa theo từng đoạn thay vì đọc cả file vào RAM
+SPOOL_FOLDER = os.path.join(UPLOAD_FOLDER, 'spool')
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+def spool_upload(file):
+    return UploadSpool.from_stream(file.stream, file.filename, SPOOL_FOLDER, SPOOL_CHUNK_SIZE)
+
+# Peer chỉ nhận hash + chữ ký; file đang chờ xác minh được giữ ở đây để peer tải về khi thật sự cần
+ATTESTATION_MAX_AGE = 300
+# True: peer luôn tải file về để tự trích xuất và kiểm tra lại nội dung
+ATTESTATION_FETCH_CONTENT = False
+pending_uploads = {}
+# origin -> (địa chỉ khóa ký của node đó, thời điểm lấy); lấy lại khi chữ ký không khớp để nhận khóa mới
+# nếu node đã đổi khóa, nhưng không quá một lần mỗi PEER_SIGNER_REFRESH_INTERVAL giây
+PEER_SIGNER_REFRESH_INTERVAL = 60
+peer_signers = {}
+
 # Danh sách từ khóa không lành mạnh
 BLACKLIST_KEYWORDS = ['offensive', 'inappropriate', 'hate', 'violence', 'illegal']
 
+# Gửi song song tới các peer, thử lại với backoff tăng dần
+broadcaster = PeerBroadcaster(sessions=peer_sessions)
+
 def broadcast_with_retry(url, data=None, files=None, retries=3, timeout=60):
-    for attempt in range(retries):
-        try:
-            if files:
-                response = requests.post(url, data=data, files=files, timeout=timeout)
-            else:
-                response = requests.post(url, json=data, timeout=timeout)
-            print(f"Broadcast tới {url}: {response.status_code}, response={response.text}")
-            return response
-        except Exception as e:
-            print(f"Lỗi khi broadcast tới {url}, lần thử {attempt + 1}/{retries}: {str(e)}")
-            if attempt < retries - 1:
-                time.sleep(2)
-    print(f"Broadcast tới {url} thất bại sau {retries} lần thử")
-    return None
+    return broadcaster.post(url, data=data, files=files, timeout=timeout, retries=retries)
 
 def check_node_status(node_url, retries=5, delay=2):
     for attempt in range(retries):
         try:
-            response = requests.get(f'{node_url}/ping', timeout=5)
+            response = peer_sessions.get(f'{node_url}/ping', timeout=5)
             if response.status_code == 200:
                 print(f"Node {node_url} sẵn sàng")
                 return True
@@ -112,72 +346,20 @@ def check_node_status(node_url, retries=5, delay=2):
     print(f"Node {node_url} không sẵn sàng sau {retries} lần thử")
     return False
 
-def normalize_text(text):
-    """Chuẩn hóa văn bản trước khi tạo MinHash."""
-    if not text:
-        return ""
-    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
-    text = text.lower()
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'[^\w\s]', '', text)
-    return text.strip()
-
-def extract_text(file_content, filename):
-    """Trích xuất văn bản từ file."""
-    text_extensions = ['.txt', '.md']
-    supported_extensions = text_extensions + ['.pdf', '.docx']
-    
-    if any(filename.lower().endswith(ext) for ext in supported_extensions):
-        try:
-            text = ""
-            if filename.lower().endswith('.txt') or filename.lower().endswith('.md'):
-                text = file_content.decode('utf-8', errors='ignore')
-            elif filename.lower().endswith('.pdf'):
-                with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text() or ""
-                        text += page_text
-            elif filename.lower().endswith('.docx'):
-                doc = Document(io.BytesIO(file_content))
-                for para in doc.paragraphs:
-                    text += para.text + "\n"
-            text = normalize_text(text)
-            if not text:
-                print(f"Không trích xuất được văn bản từ {filename}: Văn bản rỗng hoặc chỉ chứa khoảng trắng")
-                return None
-            print(f"Trích xuất văn bản từ {filename}: {text[:50]}...")
-            return text
-        except Exception as e:
-            print(f"Lỗi khi trích xuất văn bản từ {filename}: {str(e)}")
-            return None
-    print(f"Định dạng file {filename} không được hỗ trợ")
-    return None
-
-def check_text_content(file_content, filename):
+def check_text_content(document):
     """Kiểm tra nội dung văn bản để phát hiện từ khóa không lành mạnh."""
-    text = extract_text(file_content, filename)
+    text = document.text
     if text:
         for keyword in BLACKLIST_KEYWORDS:
             if keyword.lower() in text.lower():
-                print(f"Phát hiện từ khóa không lành mạnh trong {filename}: {keyword}")
+                print(f"Phát hiện từ khóa không lành mạnh trong {document.filename}: {keyword}")
                 return False, f"Nội dung chứa từ khóa không lành mạnh: {keyword}"
         return True, "Nội dung văn bản hợp lệ"
     return False, "File rỗng hoặc chỉ chứa khoảng trắng"
 
-def get_content_hash(file_content, filename):
+def get_content_hash(document):
     """Tạo MinHash từ nội dung văn bản."""
-    text = extract_text(file_content, filename)
-    if text:
-        words = text.split()
-        shingles = {f"{words[i]} {words[i+1]} {words[i+2]}" for i in range(len(words)-2)}
-        m = MinHash(num_perm=128)
-        for s in shingles:
-            m.update(s.encode('utf8'))
-        hash_value = ','.join(map(str, m.hashvalues))
-        print(f"Tạo content_hash cho {filename}: {hash_value[:50]}...")
-        return hash_value
-    print(f"Không tạo được content_hash cho {filename}")
-    return None
+    return document.content_hash
 
 # def jaccard_similarity(hash1, hash2):
 #     """Tính Jaccard similarity giữa hai MinHash."""
@@ -198,46 +380,6 @@ def get_content_hash(file_content, filename):
 #         print(f"Lỗi nghiêm trọng khi tính Jaccard similarity: hash1={hash1[:50]}..., hash2={hash2[:50]}..., error={str(e)}")
 #         raise
 
-def jaccard_similarity(hash1, hash2):
-    """Tính Jaccard similarity giữa hai MinHash với độ chính xác cao."""
-    if not hash1 or not hash2:
-        print(f"Cảnh báo: Một trong hai hash rỗng - hash1={hash1}, hash2={hash2}")
-        return 0.0  # Trả về 0 nếu một trong hai hash rỗng
-    
-    # Nếu hai hash giống hệt nhau, trả về 1.0 ngay lập tức
-    if hash1 == hash2:
-        return 1.0
-    
-    try:
-        # Chuyển đổi từ chuỗi hash (dạng "num1,num2,num3,...") sang list số nguyên
-        h1 = [int(x.strip()) for x in hash1.split(',') if x.strip()]
-        h2 = [int(x.strip()) for x in hash2.split(',') if x.strip()]
-        
-        # Kiểm tra độ dài hash
-        if len(h1) != 128 or len(h2) != 128:
-            print(f"Cảnh báo: Độ dài hash không hợp lệ - len(hash1)={len(h1)}, len(hash2)={len(h2)}")
-            return 0.0
-        
-        # Tạo MinHash từ hashvalues
-        m1 = MinHash(num_perm=128)
-        m2 = MinHash(num_perm=128)
-        m1.hashvalues = h1
-        m2.hashvalues = h2
-        
-        # Tính similarity với độ chính xác cao
-        similarity = m1.jaccard(m2)
-        
-        # Debug: Kiểm tra nếu similarity thấp bất thường với hash gần giống
-        if similarity < 0.7 and sum(1 for a, b in zip(h1, h2) if a == b) > 100:
-            print(f"⚠️ Cảnh báo: Similarity thấp bất thường ({similarity:.4f}) dù có {sum(1 for a, b in zip(h1, h2) if a == b)} giá trị hash trùng nhau")
-        
-        print(f"Jaccard similarity: {similarity:.4f} (hash1={hash1[:30]}..., hash2={hash2[:30]}...)")
-        return similarity
-        
-    except Exception as e:
-        print(f"Lỗi khi tính Jaccard similarity: {str(e)}")
-        return 0.0  # Trả về 0 nếu có lỗi
-
 # def check_content_similarity(file_content, filename, current_content_hash):
 #     """Kiểm tra độ giống nhau của nội dung với các tài liệu đã lưu."""
 #     if not current_content_hash:
@@ -282,51 +424,73 @@ def jaccard_similarity(hash1, hash2):
 #     print(f"Tài liệu {filename} không giống bất kỳ tài liệu nào đã lưu")
 #     return True, None, "Tài liệu không giống bất kỳ tài liệu nào đã lưu"
 
-def check_content_similarity(file_content, filename, current_content_hash):
-    """Kiểm tra độ giống nhau của nội dung với các tài liệu đã lưu."""
+def check_content_similarity(filename, current_content_hash, version):
+    """Kiểm tra độ giống nhau của nội dung với các tài liệu đã lưu (version: định dạng của content_hash)."""
     if not current_content_hash:
         print(f"Bỏ qua kiểm tra độ giống cho {filename}: Không có content_hash")
         return True, None, "Không kiểm tra độ giống nhau (không phải văn bản)"
 
-    blockchain.nodes = set(node_registry.get_peers())
-    print(f"Nodes trước khi đồng bộ: {blockchain.nodes}")
-    try:
-        blockchain.replace_chain()
-    except Exception as e:
-        print(f"Lỗi khi đồng bộ blockchain: {str(e)}")
-        return True, None, "Không kiểm tra độ giống (lỗi đồng bộ blockchain)"
-    print(f"Đã đồng bộ blockchain, length={len(blockchain.chain)}")
+    # Chuỗi cục bộ được giữ cập nhật bởi chain_sync, không đồng bộ trong request
+    print(f"Kiểm tra độ giống trên chuỗi cục bộ, length={len(blockchain.chain)}")
 
-    if len(blockchain.chain) <= 1:
-        print("Blockchain rỗng hoặc chỉ có genesis block, không kiểm tra độ giống")
+    # Chỉ mục gồm cả giao dịch đang chờ, nên vẫn phải tra khi chuỗi mới chỉ có genesis block
+    if len(similarity_index) == 0:
+        print("Chưa có content_hash nào trong chỉ mục, không kiểm tra độ giống")
         return True, None, "Tài liệu không giống bất kỳ tài liệu nào đã lưu"
 
-    for block in blockchain.chain:
-        transactions = block.get('transactions', [])
-        if not transactions:
-            print(f"Block {block['index']} không có giao dịch")
-            continue
-        for tx in transactions:
-            document_hash_obj = tx.get('document_hash', {})
-            stored_content_hash = document_hash_obj.get('content_hash')
-            if stored_content_hash:
-                print(f"⚠️ So sánh với content_hash lưu: {stored_content_hash}")
-                try:
-                    similarity = jaccard_similarity(current_content_hash, stored_content_hash)
-                    if similarity >= 0.65: 
-                        print(f"Tài liệu {filename} giống {similarity*100:.2f}% với hash={stored_content_hash}")
-                        return False, stored_content_hash, f"Tài liệu giống {similarity*100:.2f}%"
-                except Exception as e:
-                    print(f"Lỗi khi so sánh content_hash: {str(e)}")
-                    continue
+    try:
+        match = similarity_index.find_similar(current_content_hash, version)
+    except Exception as e:
+        print(f"Lỗi khi so sánh content_hash: {str(e)}")
+        match = None
+    if match:
+        _, stored_content_hash, similarity = match
+        print(f"Tài liệu {filename} giống {similarity*100:.2f}% với hash={stored_content_hash}")
+        return False, stored_content_hash, f"Tài liệu giống {similarity*100:.2f}%"
 
     print(f"Tài liệu {filename} không giống bất kỳ tài liệu nào đã lưu")
     return True, None, "Tài liệu không giống bất kỳ tài liệu nào đã lưu"
 
+def mine_pending_block():
+    """Đào block cho các giao dịch đang chờ; nếu tip thay đổi trong lúc đào thì đào lại trên tip mới."""
+    while True:
+        previous_block = blockchain.get_previous_block()
+        proof = blockchain.proof_of_work(previous_block['proof'])
+        # create_block kiểm tra tip và nối block trong cùng một lần giữ blockchain.lock
+        block = blockchain.create_block(proof, previous_block=previous_block) if proof is not None else None
+        if block is None:
+            print("Đã có block mới trong lúc đào, đào lại trên tip mới")
+            continue
+        return block
+
+def broadcast_block(block):
+    current_node = f'http://{get_local_ip()}:{app.config.get("PORT", 5000)}'
+    peers = [node for node in blockchain.nodes if node != current_node]
+    broadcaster.broadcast(peers, '/add_block', block, timeout=60)
+
+# Gom giao dịch theo số lượng/khoảng thời gian rồi đào ở luồng nền thay vì đào cho từng upload
+ASYNC_MINING = True
+BLOCK_MAX_TRANSACTIONS = 100
+BLOCK_MAX_WAIT = 5
+block_producer = BlockProducer(
+    blockchain,
+    mine_pending_block,
+    on_block=broadcast_block,
+    max_batch=BLOCK_MAX_TRANSACTIONS,
+    max_wait=BLOCK_MAX_WAIT
+)
+
 @app.route('/ping', methods=['GET'])
 def ping():
     return jsonify({'message': 'Node đang hoạt động'}), 200
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'extraction_cache': extraction_cache.stats(),
+        'ethereum_verification': eth_verifier.stats()
+    }), 200
+
 @app.route('/get_ip', methods=['GET'])
 def get_ip():
     local_ip = get_local_ip()
@@ -349,21 +513,24 @@ def store_document():
     if file.filename == '':
         return jsonify({'message': 'Không có file được chọn'}), 400
 
+    spool = None
+    # Khi đã gửi file cho các peer, file tạm chỉ được xóa sau khi mọi request broadcast kết thúc
+    spool_in_use = False
     try:
-        file_content = file.read()
-        if len(file_content) == 0:
+        spool = spool_upload(file)
+        document = AnalyzedDocument.from_spool(spool, cache=extraction_cache)
+        if len(document) == 0:
             print(f"File {file.filename} rỗng, không được phép lưu")
             return jsonify({'message': 'File rỗng', 'is_valid': False}), 400
 
-        text = extract_text(file_content, file.filename)
-        if text is None:
+        if document.text is None:
             print(f"File {file.filename} rỗng hoặc chỉ chứa khoảng trắng")
             return jsonify({'message': 'File rỗng hoặc chỉ chứa khoảng trắng', 'is_valid': False}), 400
 
-        document_hash = hashlib.sha256(file_content).hexdigest()
-        content_hash = get_content_hash(file_content, file.filename)
+        document_hash = document.document_hash
+        content_hash = get_content_hash(document)
 
-        if blockchain.verify_document(document_hash):
+        if blockchain.verify_document(document_hash, include_pending=True):
             print(f"Tài liệu đã tồn tại: document_hash={document_hash}")
             return jsonify({
                 'message': 'Tài liệu đã tồn tại trong blockchain',
@@ -371,7 +538,7 @@ def store_document():
                 'is_valid': False
             }), 400
 
-        is_text_valid, text_message = check_text_content(file_content, file.filename)
+        is_text_valid, text_message = check_text_content(document)
         if not is_text_valid:
             print(f"Nội dung không hợp lệ: {text_message}")
             return jsonify({'message': text_message, 'is_valid': False}), 400
@@ -379,7 +546,7 @@ def store_document():
         if content_hash:
             print(f"Đang kiểm tra độ giống với content_hash: {content_hash[:50]}...")
             is_content_valid, similar_hash, similarity_message = check_content_similarity(
-                file_content, file.filename, content_hash
+                file.filename, content_hash, CONTENT_HASH_VERSION
             )
             print(f"Kết quả kiểm tra: is_valid={is_content_valid}, similar_hash={similar_hash}, message={similarity_message}")
             if not is_content_valid:
@@ -390,34 +557,46 @@ def store_document():
                     'is_valid': False
                 }), 400
 
-        data_to_send = {'document_hash': document_hash, 'content_hash': content_hash or ""}
-        files_to_send = {'file': (file.filename, file_content)}
-        local_response = verify_transaction_local(data_to_send, files_to_send)
+        data_to_send = {
+            'version': CONTENT_HASH_VERSION,
+            'document_hash': document_hash,
+            'content_hash': content_hash or ""
+        }
+        local_response = verify_transaction_local(data_to_send, document)
         if not local_response['is_valid']:
             print(f"Kiểm tra cục bộ thất bại: {local_response['message']}")
             return jsonify(local_response), 400
 
         blockchain.nodes = set(node_registry.get_peers())
         current_node = f'http://{get_local_ip()}:{request.environ["SERVER_PORT"]}'
-        verification_results = [local_response['is_valid']]
+        peers = [node for node in blockchain.nodes if node != current_node]
         print(f"Bắt đầu xác minh với nodes: {blockchain.nodes}")
 
-        for node in blockchain.nodes:
-            if node != current_node:
-                response = broadcast_with_retry(
-                    f'{node}/verify_transaction',
-                    data=data_to_send,
-                    files=files_to_send,
-                    timeout=60
-                )
-                if response and response.status_code == 200:
-                    verification_results.append(response.json()['is_valid'])
-                else:
-                    print(f"Node {node} không phản hồi hoặc xác minh thất bại")
-                    verification_results.append(False)
+        # Gửi hash kèm chữ ký thay vì file; peer tải file qua /pending_upload khi cần
+        attestation_to_send = dict(
+            data_to_send,
+            filename=file.filename,
+            origin=current_node,
+            attestation=node_identity.attest(document_hash, data_to_send['content_hash'], current_node)
+        )
+        pending_uploads[document_hash] = spool
+
+        def release_spool():
+            if pending_uploads.get(document_hash) is spool:
+                del pending_uploads[document_hash]
+            spool.remove()
 
         total_nodes = len(blockchain.nodes)
-        valid_count = sum(1 for result in verification_results if result)
+        valid_count, _ = broadcaster.collect_majority(
+            peers,
+            '/verify_attestation',
+            data=attestation_to_send,
+            total_nodes=total_nodes,
+            local_votes=1 if local_response['is_valid'] else 0,
+            timeout=60,
+            on_complete=release_spool
+        )
+        spool_in_use = True
         if valid_count <= total_nodes / 2:
             print(f"Không đạt đồng thuận: {valid_count}/{total_nodes} node xác minh hợp lệ")
             return jsonify({
@@ -426,23 +605,31 @@ def store_document():
                 'total_nodes': total_nodes
             }), 403
 
-        transaction_data = {'document_hash': document_hash, 'content_hash': content_hash or ""}
+        transaction_data = {
+            'version': CONTENT_HASH_VERSION,
+            'document_hash': document_hash,
+            'content_hash': content_hash or ""
+        }
         block_index = blockchain.add_transaction(transaction_data)
         print(f"Đã thêm giao dịch: document_hash={document_hash}, content_hash={content_hash[:50] if content_hash else 'None'}..., index={block_index}")
 
-        for node in blockchain.nodes:
-            if node != current_node:
-                broadcast_with_retry(f'{node}/add_transaction', transaction_data)
+        broadcaster.broadcast(peers, '/add_transaction', transaction_data)
+
+        if ASYNC_MINING and block_producer.status()['running']:
+            block_producer.notify()
+            print(f"Tài liệu đang chờ đào: document_hash={document_hash}, block_index dự kiến={block_index}")
+            return jsonify({
+                'message': 'Tài liệu đã được chấp nhận và đang chờ đưa vào block',
+                'file_hash': document_hash,
+                'block_index': block_index,
+                'status': 'pending',
+                'status_url': f'/transaction_status/{document_hash}'
+            }), 202
 
         if len(blockchain.transactions) >= 1:
-            previous_block = blockchain.get_previous_block()
-            proof = blockchain.proof_of_work(previous_block['proof'])
-            previous_hash = blockchain.hash_block(previous_block)
-            new_block = blockchain.create_block(proof, previous_hash)
+            new_block = mine_pending_block()
 
-            for node in blockchain.nodes:
-                if node != current_node:
-                    broadcast_with_retry(f'{node}/add_block', new_block, timeout=60)
+            broadcaster.broadcast(peers, '/add_block', new_block, timeout=60)
 
         print(f"Tài liệu đã lưu thành công: document_hash={document_hash}, block_index={block_index}")
         return jsonify({
@@ -454,42 +641,43 @@ def store_document():
     except Exception as e:
         print(f"Lỗi khi lưu tài liệu: {str(e)}")
         return jsonify({'message': 'Lỗi khi lưu tài liệu', 'error': str(e)}), 500
+    finally:
+        if spool is not None and not spool_in_use:
+            spool.remove()
 
-def verify_transaction_local(data, files):
-    """Kiểm tra giao dịch cục bộ."""
+def verify_transaction_local(data, document):
+    """Kiểm tra giao dịch cục bộ, dùng lại kết quả phân tích của AnalyzedDocument."""
     document_hash = data.get('document_hash')
     content_hash = data.get('content_hash')
-    file_content = files['file'][1]
-    filename = files['file'][0]
+    filename = document.filename
 
     try:
-        if len(file_content) == 0:
+        if len(document) == 0:
             print(f"File {filename} rỗng, không được phép lưu")
             return {'message': 'File rỗng', 'is_valid': False}
 
-        text = extract_text(file_content, filename)
-        if text is None:
+        if document.text is None:
             print(f"File {filename} rỗng hoặc chỉ chứa khoảng trắng")
             return {'message': 'File rỗng hoặc chỉ chứa khoảng trắng', 'is_valid': False}
 
-        calculated_hash = hashlib.sha256(file_content).hexdigest()
+        calculated_hash = document.document_hash
         if calculated_hash != document_hash:
             print(f"Hash không khớp: calculated={calculated_hash}, received={document_hash}")
             return {'message': 'Hash không khớp', 'is_valid': False}
 
-        is_text_valid, text_message = check_text_content(file_content, filename)
+        is_text_valid, text_message = check_text_content(document)
         if not is_text_valid:
             print(f"Nội dung không hợp lệ: {text_message}")
             return {'message': text_message, 'is_valid': False}
 
-        if blockchain.verify_document(document_hash):
+        if blockchain.verify_document(document_hash, include_pending=True):
             print(f"Tài liệu đã tồn tại: document_hash={document_hash}")
             return {'message': 'Tài liệu đã tồn tại', 'is_valid': False}
 
         if content_hash:
             print(f"Kiểm tra độ giống cục bộ với content_hash: {content_hash[:50]}...")
             is_content_valid, similar_hash, similarity_message = check_content_similarity(
-                file_content, filename, content_hash
+                filename, content_hash, content_hash_version(data)
             )
             if not is_content_valid:
                 print(f"Tài liệu bị từ chối: {similarity_message}")
@@ -517,36 +705,37 @@ def verify_transaction():
     document_hash = request.form['document_hash']
     content_hash = request.form.get('content_hash')
 
+    spool = None
     try:
-        file_content = file.read()
+        spool = spool_upload(file)
+        document = AnalyzedDocument.from_spool(spool, cache=extraction_cache)
 
-        if len(file_content) == 0:
+        if len(document) == 0:
             print(f"File {file.filename} rỗng, không được phép lưu")
             return jsonify({'message': 'File rỗng', 'is_valid': False}), 400
 
-        text = extract_text(file_content, file.filename)
-        if text is None:
+        if document.text is None:
             print(f"File {file.filename} rỗng hoặc chỉ chứa khoảng trắng")
             return jsonify({'message': 'File rỗng hoặc chỉ chứa khoảng trắng', 'is_valid': False}), 400
 
-        calculated_hash = hashlib.sha256(file_content).hexdigest()
+        calculated_hash = document.document_hash
         if calculated_hash != document_hash:
             print(f"Hash không khớp: calculated={calculated_hash}, received={document_hash}")
             return jsonify({'message': 'Hash không khớp', 'is_valid': False}), 400
 
-        is_text_valid, text_message = check_text_content(file_content, file.filename)
+        is_text_valid, text_message = check_text_content(document)
         if not is_text_valid:
             print(f"Nội dung không hợp lệ: {text_message}")
             return jsonify({'message': text_message, 'is_valid': False}), 400
 
-        if blockchain.verify_document(document_hash):
+        if blockchain.verify_document(document_hash, include_pending=True):
             print(f"Tài liệu đã tồn tại: document_hash={document_hash}")
             return jsonify({'message': 'Tài liệu đã tồn tại', 'is_valid': False}), 400
 
         if content_hash:
             print(f"Đang kiểm tra độ giống với content_hash: {content_hash[:50]}...")
             is_content_valid, similar_hash, similarity_message = check_content_similarity(
-                file_content, file.filename, content_hash
+                file.filename, content_hash, content_hash_version(request.form)
             )
             print(f"Kết quả kiểm tra: is_valid={is_content_valid}, similar_hash={similar_hash}, message={similarity_message}")
             if not is_content_valid:
@@ -571,6 +760,116 @@ def verify_transaction():
             'is_valid': False,
             'error': str(e)
         }), 500
+    finally:
+        if spool is not None:
+            spool.remove()
+
+def is_registered_peer(origin):
+    # Chỉ gửi request tới node đã đăng ký, không tới URL tùy ý do client gửi lên
+    return origin in node_registry.get_peers()
+
+def get_peer_signer(origin, refresh=False):
+    """Địa chỉ khóa ký của node origin, lấy qua /node_identity và lưu lại.
+
+    refresh=True: lấy lại nếu lần lấy trước đã quá PEER_SIGNER_REFRESH_INTERVAL giây (node đổi khóa).
+    """
+    if not is_registered_peer(origin):
+        raise ValueError(f'{origin} không phải node đã đăng ký')
+    cached = peer_signers.get(origin)
+    if cached is not None and not (refresh and time.time() - cached[1] >= PEER_SIGNER_REFRESH_INTERVAL):
+        return cached[0]
+    response = peer_sessions.get(f'{origin}/node_identity', timeout=10)
+    response.raise_for_status()
+    peer_signers[origin] = (response.json()['address'], time.time())
+    return peer_signers[origin][0]
+
+def fetch_pending_upload(origin, document_hash, filename):
+    """Tải file đang chờ xác minh từ node origin về file spool cục bộ."""
+    if not is_registered_peer(origin):
+        raise ValueError(f'{origin} không phải node đã đăng ký')
+    response = peer_sessions.get(f'{origin}/pending_upload/{document_hash}', timeout=60, stream=True)
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return UploadSpool.from_stream(response.raw, filename, SPOOL_FOLDER, SPOOL_CHUNK_SIZE)
+    finally:
+        response.close()
+
+@app.route('/node_identity', methods=['GET'])
+def get_node_identity():
+    return jsonify({'address': node_identity.address}), 200
+
+@app.route('/pending_upload/<document_hash>', methods=['GET'])
+def get_pending_upload(document_hash):
+    spool = pending_uploads.get(document_hash)
+    if spool is None:
+        return jsonify({'message': 'Không có file đang chờ xác minh với hash này'}), 404
+    return send_file(spool.path, as_attachment=True, download_name=spool.filename)
+
+@app.route('/verify_attestation', methods=['POST'])
+def verify_attestation_route():
+    data = request.get_json(silent=True) or {}
+    document_hash = data.get('document_hash')
+    content_hash = data.get('content_hash') or ""
+    filename = data.get('filename') or ''
+    origin = data.get('origin')
+    attestation = data.get('attestation')
+    if not is_sha256_hex(document_hash) or not origin or not attestation:
+        return jsonify({'message': 'Thiếu document_hash, origin hoặc attestation', 'is_valid': False}), 400
+    if not is_registered_peer(origin):
+        print(f"Từ chối xác nhận từ node chưa đăng ký: {origin}")
+        return jsonify({'message': 'origin không phải node đã đăng ký', 'is_valid': False}), 403
+
+    spool = None
+    try:
+        is_signed, reason = verify_attestation(attestation, document_hash, content_hash, origin, ATTESTATION_MAX_AGE)
+        if not is_signed:
+            print(f"Chữ ký xác nhận không hợp lệ từ {origin}: {reason}")
+            return jsonify({'message': reason, 'is_valid': False}), 400
+        if (get_peer_signer(origin) != attestation['signer']
+                and get_peer_signer(origin, refresh=True) != attestation['signer']):
+            print(f"Khóa ký {attestation['signer']} không thuộc node {origin}")
+            return jsonify({'message': 'Khóa ký không thuộc node gửi', 'is_valid': False}), 400
+
+        if blockchain.verify_document(document_hash, include_pending=True):
+            print(f"Tài liệu đã tồn tại: document_hash={document_hash}")
+            return jsonify({'message': 'Tài liệu đã tồn tại', 'is_valid': False}), 400
+
+        if content_hash:
+            is_content_valid, similar_hash, similarity_message = check_content_similarity(
+                filename, content_hash, content_hash_version(data)
+            )
+            if not is_content_valid:
+                print(f"Tài liệu bị từ chối: {similarity_message}")
+                return jsonify({
+                    'message': similarity_message,
+                    'is_valid': False,
+                    'similar_hash': similar_hash
+                }), 400
+
+        # Chỉ tải file khi không có content_hash để so sánh hoặc node được cấu hình tự kiểm tra nội dung
+        if not content_hash or ATTESTATION_FETCH_CONTENT:
+            print(f"Tải file {document_hash} từ {origin} để kiểm tra nội dung")
+            spool = fetch_pending_upload(origin, document_hash, filename)
+            document = AnalyzedDocument.from_spool(spool, cache=extraction_cache)
+            local_response = verify_transaction_local(
+                {'version': data.get('version'), 'document_hash': document_hash, 'content_hash': content_hash}, document
+            )
+            return jsonify(local_response), 200 if local_response['is_valid'] else 400
+
+        print(f"Tài liệu được xác minh qua chữ ký của {origin}: document_hash={document_hash}")
+        return jsonify({
+            'message': 'Xác minh thành công',
+            'is_valid': True,
+            'document_hash': document_hash
+        }), 200
+
+    except Exception as e:
+        print(f"Lỗi khi xác minh chữ ký: {str(e)}")
+        return jsonify({'message': 'Lỗi khi xác minh', 'is_valid': False, 'error': str(e)}), 500
+    finally:
+        if spool is not None:
+            spool.remove()
 
 @app.route('/store_on_ethereum', methods=['POST'])
 def store_on_ethereum():
@@ -582,48 +881,167 @@ def store_on_ethereum():
         return jsonify({'message': 'Không có file được chọn'}), 400
 
     try:
-        file_content = file.read()
-        document_hash = hashlib.sha256(file_content).hexdigest()
+        document_hash = hash_stream(file.stream)
         private_key = request.form.get('private_key')
         if not private_key:
             return jsonify({'message': 'Thiếu private key'}), 400
+        return anchor_response(document_hash, private_key, request.form.get('wait') == 'true')
 
-        account = Account.from_key(private_key)
-        transaction = contract.functions.storeDocument(document_hash).build_transaction({
-            'chainId': 31337,
-            'gas': 100000,
-            'gasPrice': web3.to_wei('10', 'gwei'),
-            'nonce': web3.eth.get_transaction_count(account.address),
-        })
+    except Exception as e:
+        return jsonify({'message': 'Lỗi khi lưu trên Ethereum', 'error': str(e)}), 500
 
-        signed_txn = web3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+def anchor_response(document_hashes, private_key, wait=False):
+    """Đưa hash vào hàng đợi Ethereum; wait=True giữ hành vi cũ là chờ receipt trong request."""
+    anchor_service.start()
+    job_id = anchor_service.submit(document_hashes, private_key)
+    if wait:
+        job = anchor_service.wait(job_id)
+        if job['status'] == 'failed':
+            return jsonify({'message': 'Lỗi khi lưu trên Ethereum', 'error': job['error'], 'job_id': job_id}), 500
+        if job['status'] == 'confirmed':
+            return jsonify({
+                'message': 'Đã lưu trên Ethereum',
+                'file_hash': job['document_hashes'][0],
+                'document_hashes': job['document_hashes'],
+                'tx_hash': job['tx_hash'],
+                'block_number': job['block_number'],
+                'job_id': job_id
+            }), 201
+    return jsonify({
+        'message': 'Đã đưa vào hàng đợi lưu trên Ethereum',
+        'document_hashes': [document_hashes] if isinstance(document_hashes, str) else document_hashes,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/ethereum_status/{job_id}'
+    }), 202
+
+@app.route('/store_hashes_on_ethereum', methods=['POST'])
+def store_hashes_on_ethereum():
+    """Lưu nhiều document_hash (client đã tự băm) trong một giao dịch storeDocuments."""
+    json_data = request.get_json(silent=True) or {}
+    document_hashes = json_data.get('document_hashes') or []
+    private_key = json_data.get('private_key')
+    if not private_key:
+        return jsonify({'message': 'Thiếu private key'}), 400
+    if not document_hashes or not all(is_sha256_hex(h) for h in document_hashes):
+        return jsonify({'message': 'document_hashes phải là danh sách SHA-256 hex'}), 400
+    if len(document_hashes) > 1 and not contract_supports('storeDocuments'):
+        return jsonify({'message': 'Contract chưa có storeDocuments, hãy biên dịch và deploy lại contract'}), 501
+    try:
+        return anchor_response([h.lower() for h in document_hashes], private_key, bool(json_data.get('wait')))
+    except Exception as e:
+        return jsonify({'message': 'Lỗi khi lưu trên Ethereum', 'error': str(e)}), 500
 
-        return jsonify({
-            'message': 'Đã lưu trên Ethereum',
-            'file_hash': document_hash,
-            'tx_hash': tx_hash.hex(),
-            'block_number': receipt['blockNumber']
-        }), 201
+@app.route('/ethereum_status/<job_id>', methods=['GET'])
+def ethereum_status(job_id):
+    job = anchor_service.status(job_id)
+    if job is None:
+        return jsonify({'job_id': job_id, 'status': 'unknown'}), 404
+    return jsonify(job), 200
+
+@app.route('/ethereum_queue_status', methods=['GET'])
+def ethereum_queue_status():
+    return jsonify(anchor_service.stats()), 200
+
+def hash_stream(stream, chunk_size=1024 * 1024):
+    """Tính SHA-256 theo từng đoạn, không đọc cả file vào bộ nhớ."""
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+def is_sha256_hex(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value.lower())
+
+def get_request_document_hash():
+    """Lấy SHA-256 từ file tải lên, hoặc từ trường document_hash (form/JSON) nếu client đã tự băm.
+
+    Trả về (document_hash, lỗi); lỗi là None nếu hợp lệ.
+    """
+    if 'file' in request.files:
+        return hash_stream(request.files['file'].stream), None
+    json_data = request.get_json(silent=True) or {}
+    document_hash = request.form.get('document_hash') or json_data.get('document_hash')
+    if not document_hash:
+        return None, 'Không có file hoặc document_hash trong request'
+    if not is_sha256_hex(document_hash):
+        return None, 'document_hash không phải SHA-256 hex'
+    return document_hash.lower(), None
+
+def get_request_merkle_proof(document_hash):
+    """Proof gửi kèm request (merkle_root + proof), hoặc proof của lô Merkle cục bộ đã được lưu lên Ethereum."""
+    if not contract_supports('verifyDocumentProof'):
+        return None
+    json_data = request.get_json(silent=True) or {}
+    merkle_root = request.form.get('merkle_root') or json_data.get('merkle_root')
+    if merkle_root:
+        proof = json_data.get('proof')
+        if proof is None:
+            proof = [p for p in request.form.get('proof', '').split(',') if p]
+        return {'merkle_root': merkle_root, 'proof': proof}
+    local_proof = merkle_anchor.proof(document_hash)
+    if local_proof and local_proof['status'] == 'confirmed':
+        return local_proof
+    return None
 
+@app.route('/store_on_ethereum_batch', methods=['POST'])
+def store_on_ethereum_batch():
+    """Đưa tài liệu vào lô Merkle kế tiếp thay vì gửi một giao dịch riêng."""
+    if not merkle_anchor.enabled:
+        return jsonify({'message': 'Node chưa cấu hình ETH_ANCHOR_PRIVATE_KEY hoặc contract chưa có storeMerkleRoot'}), 503
+    document_hash, error = get_request_document_hash()
+    if error:
+        return jsonify({'message': error}), 400
+    try:
+        merkle_anchor.start()
+        is_new = merkle_anchor.add(document_hash)
+        return jsonify({
+            'message': 'Đã đưa vào lô Merkle' if is_new else 'Tài liệu đã có trong lô Merkle',
+            'document_hash': document_hash,
+            'proof_url': f'/merkle_proof/{document_hash}'
+        }), 202
     except Exception as e:
-        return jsonify({'message': 'Lỗi khi lưu trên Ethereum', 'error': str(e)}), 500
+        return jsonify({'message': 'Lỗi khi đưa vào lô Merkle', 'error': str(e)}), 500
+
+@app.route('/merkle_proof/<document_hash>', methods=['GET'])
+def merkle_proof(document_hash):
+    proof = merkle_anchor.proof(document_hash.lower())
+    if proof is None:
+        return jsonify({'document_hash': document_hash, 'status': 'unknown'}), 404
+    return jsonify(proof), 200 if proof['status'] == 'confirmed' else 202
+
+@app.route('/merkle_status', methods=['GET'])
+def merkle_status():
+    return jsonify(merkle_anchor.stats()), 200
 
 @app.route('/verify_on_ethereum', methods=['POST'])
 def verify_on_ethereum():
-    if 'file' not in request.files:
-        return jsonify({'message': 'Không có file trong request'}), 400
+    document_hash, error = get_request_document_hash()
+    if error:
+        return jsonify({'message': error}), 400
 
-    file = request.files['file']
     try:
-        file_content = file.read()
-        document_hash = hashlib.sha256(file_content).hexdigest()
-        is_stored = contract.functions.verifyDocument(document_hash).call()
+        merkle_proof = get_request_merkle_proof(document_hash)
+        if merkle_proof is not None:
+            is_stored = contract.functions.verifyDocumentProof(
+                bytes.fromhex(document_hash),
+                [bytes.fromhex(sibling) for sibling in merkle_proof['proof']],
+                bytes.fromhex(merkle_proof['merkle_root'])
+            ).call()
+            return jsonify({
+                'document_hash': document_hash,
+                'is_verified': is_stored,
+                'method': 'merkle_proof',
+                'merkle_root': merkle_proof['merkle_root'],
+                'message': 'Tài liệu hợp lệ' if is_stored else 'Proof không khớp với gốc Merkle trên Ethereum'
+            }), 200
+
+        is_stored = eth_verifier.verify(document_hash)
 
         return jsonify({
             'document_hash': document_hash,
             'is_verified': is_stored,
+            'method': 'direct',
             'message': 'Tài liệu hợp lệ' if is_stored else 'Tài liệu không tồn tại trên Ethereum'
         }), 200
 
@@ -635,18 +1053,29 @@ def add_transaction():
     json_data = request.get_json()
     if not json_data or 'document_hash' not in json_data:
         return jsonify({'message': 'Thiếu document_hash'}), 400
-    index = blockchain.add_transaction(json_data)
+    # Giao dịch do node gốc đào, node này chỉ ghi nhận để chặn trùng lặp
+    index = blockchain.add_remote_transaction(json_data)
     return jsonify({'message': f'Giao dịch sẽ được ghi vào block {index}'}), 201
 
+@app.route('/transaction_status/<document_hash>', methods=['GET'])
+def transaction_status(document_hash):
+    status = blockchain.transaction_status(document_hash)
+    if status is None:
+        return jsonify({'document_hash': document_hash, 'status': 'unknown'}), 404
+    status['document_hash'] = document_hash
+    return jsonify(status), 200
+
+@app.route('/producer_status', methods=['GET'])
+def producer_status():
+    return jsonify(block_producer.status()), 200
+
 @app.route('/verify_document', methods=['POST'])
 def verify_document():
-    if 'file' not in request.files:
-        return jsonify({'message': 'Không có file trong request'}), 400
+    document_hash, error = get_request_document_hash()
+    if error:
+        return jsonify({'message': error}), 400
 
-    file = request.files['file']
     try:
-        file_content = file.read()
-        document_hash = hashlib.sha256(file_content).hexdigest()
         is_verified = blockchain.verify_document(document_hash)
 
         return jsonify({
@@ -658,77 +1087,233 @@ def verify_document():
     except Exception as e:
         return jsonify({'message': 'Lỗi khi kiểm tra', 'error': str(e)}), 500
 
+def verify_hash_result(document_hash, check_ethereum=True, ethereum_results=None):
+    """Kết quả xác minh một document_hash trên chuỗi cục bộ và (tùy chọn) trên contract.
+
+    ethereum_results: kết quả đã tra theo lô bằng verify_on_ethereum_many, tránh gọi RPC cho từng hash.
+    """
+    location = blockchain.find_document(document_hash)
+    result = {
+        'document_hash': document_hash,
+        'on_chain': location is not None,
+        'block_index': location[0] if location else None
+    }
+    if check_ethereum:
+        if ethereum_results is None:
+            ethereum_results = verify_on_ethereum_many([document_hash])
+        if 'error' in ethereum_results:
+            result['on_ethereum'] = None
+            result['ethereum_error'] = ethereum_results['error']
+        else:
+            result['on_ethereum'] = ethereum_results.get(document_hash)
+    return result
+
+def verify_on_ethereum_many(document_hashes):
+    """Tra nhiều hash trên contract trong ít round-trip nhất; lỗi RPC trả về dạng {'error': ...}."""
+    try:
+        return eth_verifier.verify_many(document_hashes)
+    except Exception as e:
+        print(f"Lỗi khi xác minh hàng loạt trên Ethereum: {str(e)}")
+        return {'error': str(e)}
+
+@app.route('/verify_on_ethereum_batch', methods=['POST'])
+def verify_on_ethereum_batch():
+    """Xác minh danh sách SHA-256 trên contract bằng một (hoặc vài) round-trip."""
+    json_data = request.get_json(silent=True) or {}
+    document_hashes = json_data.get('document_hashes') or request.form.getlist('document_hashes')
+    if not document_hashes:
+        return jsonify({'message': 'Cần gửi danh sách document_hashes'}), 400
+    invalid = [h for h in document_hashes if not is_sha256_hex(h)]
+    if invalid:
+        return jsonify({'message': 'document_hash không phải SHA-256 hex', 'invalid': invalid}), 400
+
+    results = verify_on_ethereum_many([h.lower() for h in document_hashes])
+    if 'error' in results:
+        return jsonify({'message': 'Lỗi khi xác minh', 'error': results['error']}), 500
+    return jsonify({
+        'results': results,
+        'total': len(results),
+        'verified': sum(1 for is_stored in results.values() if is_stored)
+    }), 200
+
+@app.route('/similar_documents', methods=['POST'])
+def similar_documents():
+    """Trả về k tài liệu giống nhất với file tải lên hoặc với content_hash cho sẵn."""
+    json_data = request.get_json(silent=True) or {}
+    try:
+        k = int(request.args.get('k', SIMILARITY_TOP_K))
+    except ValueError:
+        return jsonify({'message': 'k không hợp lệ'}), 400
+
+    spool = None
+    try:
+        if 'file' in request.files:
+            spool = spool_upload(request.files['file'])
+            content_hash = get_content_hash(AnalyzedDocument.from_spool(spool, cache=extraction_cache))
+            version = CONTENT_HASH_VERSION
+        else:
+            # content_hash cho sẵn được giải mã theo trường version đi kèm (không có = dạng thập phân)
+            content_hash = request.form.get('content_hash') or json_data.get('content_hash')
+            version = content_hash_version(request.form if 'content_hash' in request.form else json_data)
+        if not content_hash:
+            return jsonify({'message': 'Không có file văn bản hoặc content_hash trong request'}), 400
+
+        matches = similarity_index.top_k(content_hash, version, k=k)
+        return jsonify({
+            'threshold': similarity_index.threshold,
+            'indexed_documents': len(similarity_index),
+            'similar_documents': [
+                {'document_hash': document_hash, 'similarity': similarity}
+                for document_hash, _, similarity in matches
+            ]
+        }), 200
+    except Exception as e:
+        print(f"Lỗi khi tìm tài liệu giống: {str(e)}")
+        return jsonify({'message': 'Lỗi khi tìm tài liệu giống', 'error': str(e)}), 500
+    finally:
+        if spool is not None:
+            spool.remove()
+
+@app.route('/verify_hash/<document_hash>', methods=['GET'])
+def verify_hash(document_hash):
+    """Xác minh chỉ bằng SHA-256, không cần tải file lên."""
+    if not is_sha256_hex(document_hash):
+        return jsonify({'message': 'document_hash không phải SHA-256 hex'}), 400
+    check_ethereum = request.args.get('check_ethereum', 'true').lower() != 'false'
+    result = verify_hash_result(document_hash.lower(), check_ethereum)
+    result['is_verified'] = result['on_chain'] or bool(result.get('on_ethereum'))
+    result['message'] = 'Tài liệu hợp lệ' if result['is_verified'] else 'Tài liệu không tồn tại hoặc đã bị thay đổi'
+    return jsonify(result), 200
+
+@app.route('/verify_documents_batch', methods=['POST'])
+def verify_documents_batch():
+    """Xác minh nhiều file và/hoặc danh sách SHA-256 trong một request, trả kết quả dạng NDJSON từng dòng."""
+    json_data = request.get_json(silent=True) or {}
+    hashes = json_data.get('hashes') or request.form.getlist('hashes')
+    files = request.files.getlist('files')
+    check_ethereum = str(json_data.get('check_ethereum', request.form.get('check_ethereum', 'true'))).lower() != 'false'
+    if not hashes and not files:
+        return jsonify({'message': 'Cần gửi danh sách files hoặc hashes'}), 400
+
+    # Băm file ngay trong request (file tải lên có thể bị đóng khi bắt đầu stream), phần chậm là tra cứu được stream
+    file_hashes = []
+    for file in files:
+        try:
+            file_hashes.append((file.filename, hash_stream(file.stream), None))
+        except Exception as e:
+            file_hashes.append((file.filename, None, str(e)))
+
+    # Tra contract cho mọi hash hợp lệ trong một lần thay vì một RPC cho mỗi dòng kết quả
+    ethereum_results = None
+    if check_ethereum:
+        valid_hashes = [h.lower() for h in hashes if is_sha256_hex(h)] + [h for _, h, _ in file_hashes if h]
+        ethereum_results = verify_on_ethereum_many(valid_hashes) if valid_hashes else {}
+
+    def generate():
+        total = 0
+        found = 0
+        for document_hash in hashes:
+            if not is_sha256_hex(document_hash):
+                result = {'document_hash': document_hash, 'error': 'document_hash không phải SHA-256 hex'}
+            else:
+                result = verify_hash_result(document_hash.lower(), check_ethereum, ethereum_results)
+            total += 1
+            found += 1 if result.get('on_chain') else 0
+            yield json.dumps(result) + '\n'
+        for filename, document_hash, error in file_hashes:
+            result = verify_hash_result(document_hash, check_ethereum, ethereum_results) if document_hash else {'error': error}
+            result['filename'] = filename
+            total += 1
+            found += 1 if result.get('on_chain') else 0
+            yield json.dumps(result) + '\n'
+        print(f"Xác minh hàng loạt: {found}/{total} tài liệu có trên chuỗi")
+        yield json.dumps({'summary': {'total': total, 'on_chain': found}}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/get_chain', methods=['GET'])
 def get_chain():
-    blockchain.nodes = set(node_registry.get_peers())
-    blockchain.replace_chain()
     return jsonify({
         'chain': blockchain.chain,
         'length': len(blockchain.chain)
     }), 200
     
+@app.route('/get_blocks', methods=['GET'])
+def get_blocks():
+    # Tải theo độ cao: các block có index > start, phân trang bằng limit
+    start = request.args.get('start', default=0, type=int)
+    limit = min(request.args.get('limit', default=500, type=int), 1000)
+    if start < 0 or limit <= 0:
+        return jsonify({'message': 'Tham số start/limit không hợp lệ'}), 400
+    blocks = blockchain.get_blocks(start, limit)
+    return jsonify({
+        'blocks': blocks,
+        'start': start,
+        'length': len(blockchain.chain)
+    }), 200
+
+@app.route('/chain_height', methods=['GET'])
+def chain_height():
+    previous_block = blockchain.get_previous_block()
+    return jsonify({
+        'length': len(blockchain.chain),
+        'last_index': previous_block['index'],
+        'last_hash': blockchain.tip_hash()
+    }), 200
+
+@app.route('/sync_status', methods=['GET'])
+def sync_status():
+    return jsonify(chain_sync.status()), 200
+
 @app.route('/get_chain_ethereum', methods=['GET'])
 def get_chain_ethereum():
+    """Danh sách tài liệu trên Ethereum dưới dạng chuỗi khối, đọc từ chỉ mục cục bộ (?start=&limit= để phân trang)."""
     try:
-        # Kết nối với contract
-        contract_instance = web3.eth.contract(address=contract_address, abi=contract_abi)
-
-        # Tạo bộ lọc cho sự kiện DocumentStored
-        event_signature_hash = web3.keccak(text="DocumentStored(string)").hex()
-
-        event_filter = {
-            'fromBlock': 0,
-            'toBlock': 'latest',
-            'address': contract_address,
-            'topics': [event_signature_hash]
-        }
+        start = max(int(request.args.get('start', 0)), 0)
+        limit = request.args.get('limit')
+        limit = min(max(int(limit), 1), 1000) if limit is not None else None
+    except ValueError:
+        return jsonify({'message': 'start/limit không hợp lệ'}), 400
 
-        # Truy vấn logs
-        logs = web3.eth.get_logs(event_filter)
+    try:
+        # Khi luồng nền chưa chạy (vd. chạy thử qua test client) thì đọc phần log mới ngay trong request
+        if not eth_log_indexer.is_running():
+            eth_log_indexer.sync_once()
 
-        # Xử lý dữ liệu logs thành chuỗi khối
+        # Xử lý dữ liệu đã lưu thành chuỗi khối
         chain = []
-        previous_hash = "0"  # Hash khởi đầu
-        proof = 1  # Giá trị proof khởi đầu
-
-        for index, log in enumerate(logs, start=1):
-            # Giải mã dữ liệu sự kiện
-            document_hash = decode(['string'], log['data'])[0]
-            block_number = log['blockNumber']
-            tx_hash = log['transactionHash'].hex()
-            tx = web3.eth.get_transaction(tx_hash)
-            sender = tx['from']
-            timestamp = web3.eth.get_block(block_number)['timestamp']  # Lấy timestamp từ block
-
+        for index, document in enumerate(eth_log_indexer.get_documents(start, limit), start=start + 1):
             # Tạo giao dịch từ document_hash
             transactions = [
                 {
                     "document_hash": {
-                        # "content_hash": "15589848778398159345",  # Giá trị giả lập, có thể thay bằng logic khác
-                        "document_hash": document_hash
+                        "document_hash": document['document_hash']
                     }
                 }
             ]
 
             # Tính previous_hash (giả lập, có thể dùng hash của block trước)
-            current_hash = web3.keccak(hexstr=tx_hash).hex()  # Giả lập hash hiện tại
+            previous_hash = "0"
             if index > 1:
-                previous_hash = current_hash  # Hash của block trước
+                previous_hash = Web3.keccak(hexstr=document['tx_hash']).hex()
 
             # Tạo block cho chuỗi
             block = {
                 "index": index,
                 "previous_hash": previous_hash,
-                "proof": proof,  # Giá trị proof giả lập, có thể thay bằng logic PoW
-                "timestamp": timestamp,
+                "proof": index,  # Giá trị proof giả lập, có thể thay bằng logic PoW
+                "timestamp": document['timestamp'],
+                "sender": document['sender'],
                 "transactions": transactions
             }
             chain.append(block)
-            proof += 1  # Tăng proof cho block tiếp theo
 
+        status = eth_log_indexer.status()
         return jsonify({
-            "chain": chain
+            "chain": chain,
+            "length": status['indexed_documents'],
+            "start": start,
+            "last_block": status['last_block']
         }), 200
 
     except Exception as e:
@@ -736,36 +1321,40 @@ def get_chain_ethereum():
             'message': 'Lỗi khi truy xuất danh sách tài liệu',
             'error': str(e)
         }), 500
-        
+
+@app.route('/ethereum_index_status', methods=['GET'])
+def ethereum_index_status():
+    return jsonify(eth_log_indexer.status()), 200
+
 @app.route('/mine_block', methods=['POST'])
 def mine_block():
-    previous_block = blockchain.get_previous_block()
-    proof = blockchain.proof_of_work(previous_block['proof'])
-    previous_hash = blockchain.hash_block(previous_block)
-    block = blockchain.create_block(proof, previous_hash)
+    block = mine_pending_block()
 
     current_node = f'http://{get_local_ip()}:{request.environ["SERVER_PORT"]}'
-    for node in blockchain.nodes:
-        if node != current_node:
-            broadcast_with_retry(f'{node}/add_block', block, timeout=60)
+    peers = [node for node in blockchain.nodes if node != current_node]
+    broadcaster.broadcast(peers, '/add_block', block, timeout=60)
 
     return jsonify(block), 200
 
 @app.route('/add_block', methods=['POST'])
 def add_block():
     block = request.get_json()
-    previous_block = blockchain.get_previous_block()
+    # Giữ khóa từ lúc kiểm tra tip tới lúc nối block để block producer hoặc /add_block khác không chen vào
+    with blockchain.lock:
+        previous_block = blockchain.get_previous_block()
 
-    if block['previous_hash'] != blockchain.hash_block(previous_block):
-        return jsonify({'message': 'Block không hợp lệ: previous_hash không khớp'}), 400
+        if block['previous_hash'] != blockchain.tip_hash():
+            return jsonify({'message': 'Block không hợp lệ: previous_hash không khớp'}), 400
 
-    if not blockchain.is_valid_proof(block['proof'], previous_block['proof']):
-        return jsonify({'message': 'Block không hợp lệ: proof không hợp lệ'}), 400
+        if not blockchain.is_valid_proof(block['proof'], previous_block['proof']):
+            return jsonify({'message': 'Block không hợp lệ: proof không hợp lệ'}), 400
 
-    if block['index'] != previous_block['index'] + 1:
-        return jsonify({'message': 'Block không hợp lệ: index không đúng'}), 400
+        if block['index'] != previous_block['index'] + 1:
+            return jsonify({'message': 'Block không hợp lệ: index không đúng'}), 400
 
-    blockchain.chain.append(block)
+        blockchain.append_block(block)
+    # Block cạnh tranh đã tới: dừng lượt đào hiện tại để đào lại trên tip mới
+    miner.cancel()
     return jsonify({'message': 'Block đã được thêm vào chain'}), 200
 
 @app.route('/register_node', methods=['POST'])
@@ -787,17 +1376,10 @@ def register_node():
     blockchain.nodes = set(node_registry.get_peers())
 
     current_node = f'http://{get_local_ip()}:{request.environ["SERVER_PORT"]}'
-    for peer in blockchain.nodes:
-        if peer != node_url and peer != current_node:
-            broadcast_with_retry(f'{peer}/add_node', {'node_url': node_url})
-
-    try:
-        response = broadcast_with_retry(f'{node_url}/sync_chain', {'chain': blockchain.chain}, timeout=60)
-        if response and response.status_code == 200:
-            print(f"Node mới {node_url} đã đồng bộ chuỗi")
-    except Exception as e:
-        print(f"Lỗi khi đồng bộ với node mới: {str(e)}")
+    peers = [peer for peer in blockchain.nodes if peer != node_url and peer != current_node]
+    broadcaster.broadcast(peers, '/add_node', {'node_url': node_url})
 
+    # Node mới tự tải phần chuỗi còn thiếu (sync_on_join/chain_sync), bootstrap không đẩy cả chuỗi sang
     return jsonify({
         'message': 'Node đã được đăng ký',
         'total_nodes': list(blockchain.nodes)
@@ -824,17 +1406,15 @@ def sync_chain():
         return jsonify({'message': 'Thiếu chuỗi trong request'}), 400
 
     new_chain = data['chain']
-    if not blockchain.is_chain_valid(new_chain):
-        return jsonify({'message': 'Chuỗi không hợp lệ'}), 400
-
-    if len(new_chain) > len(blockchain.chain):
-        blockchain.chain = new_chain
-        return jsonify({'message': 'Chuỗi đã được đồng bộ'}), 200
-    else:
+    if len(new_chain) <= len(blockchain.chain):
         return jsonify({'message': 'Chuỗi không cần đồng bộ'}), 200
 
+    if not blockchain.merge_chain(new_chain):
+        return jsonify({'message': 'Chuỗi không hợp lệ'}), 400
+    return jsonify({'message': 'Chuỗi đã được đồng bộ'}), 200
+
 if __name__ == '__main__':
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    port = NODE_PORT
     app.config['PORT'] = port
     local_ip = get_local_ip()
     current_node_url = f'http://{local_ip}:{port}'
@@ -842,12 +1422,20 @@ if __name__ == '__main__':
     node_registry.register_node(current_node_url)
     if bootstrap_url != current_node_url:
         try:
-            response = requests.post(f'{bootstrap_url}/register_node', json={'node_url': current_node_url}, timeout=10)
+            response = peer_sessions.post(f'{bootstrap_url}/register_node', json={'node_url': current_node_url}, timeout=10)
             print(f"Đã đăng ký với bootstrap: {response.status_code}")
+            if response.status_code == 201:
+                blockchain.sync_on_join(bootstrap_url)
         except Exception as e:
             print(f"Lỗi khi đăng ký với bootstrap: {str(e)}")
 
     # node_registry.start_status_check()
+    chain_sync.start(current_node_url)
+    if ASYNC_MINING:
+        block_producer.start()
+    anchor_service.start()
+    merkle_anchor.start()
+    eth_log_indexer.start()
     app.run(host='0.0.0.0', port=port)
 
 
@@ -0,0 +1,90 @@
+# benchmark_contract.py
+# So sánh gas, calldata và thông lượng giữa DocumentStorage (khóa string) và DocumentStorageV2 (khóa bytes32)
+# trên node Ethereum cục bộ (Ganache/Hardhat/Anvil). Chạy compilesc.py trước để có file ABI/Bytecode.
+# Cách dùng: python benchmark_contract.py [--count 200] [--batch 50] [--url http://127.0.0.1:8545]
+import argparse
+import json
+import os
+import time
+from web3 import Web3
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_compiled(suffix):
+    with open(os.path.join(BASE_DIR, f"compiled_abi{suffix}.json")) as f:
+        abi = json.load(f)
+    with open(os.path.join(BASE_DIR, f"compiled_bytecode{suffix}.json")) as f:
+        bytecode = f.read()
+    return abi, bytecode
+
+def deploy(web3, suffix):
+    abi, bytecode = load_compiled(suffix)
+    tx_hash = web3.eth.contract(abi=abi, bytecode=bytecode).constructor().transact()
+    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+    return web3.eth.contract(address=receipt.contractAddress, abi=abi)
+
+def random_hashes(count):
+    return [os.urandom(32).hex() for _ in range(count)]
+
+def send_all(web3, calls):
+    """Gửi liên tiếp mọi giao dịch rồi mới chờ receipt, trả về (tổng gas, tổng calldata byte, số giây)."""
+    started = time.perf_counter()
+    tx_hashes = [call.transact() for call in calls]
+    receipts = [web3.eth.wait_for_transaction_receipt(tx_hash) for tx_hash in tx_hashes]
+    elapsed = time.perf_counter() - started
+    gas = sum(receipt['gasUsed'] for receipt in receipts)
+    calldata = sum(len(web3.eth.get_transaction(tx_hash)['input']) for tx_hash in tx_hashes)
+    return gas, calldata, elapsed
+
+def report(name, count, gas, calldata, elapsed):
+    print(f"{name:<32} gas/tài liệu={gas / count:>9.0f}  calldata/tài liệu={calldata / count:>6.1f}B  "
+          f"{count / elapsed:>8.1f} tài liệu/s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--url', default='http://127.0.0.1:8545')
+    args = parser.parse_args()
+
+    web3 = Web3(Web3.HTTPProvider(args.url))
+    if not web3.is_connected():
+        print("❌ Không thể kết nối với Ethereum node!")
+        return 1
+    web3.eth.default_account = web3.eth.accounts[0]
+
+    v1 = deploy(web3, "")
+    v2 = deploy(web3, "_v2")
+    print(f"Đã deploy v1 tại {v1.address}, v2 tại {v2.address}; {args.count} tài liệu, lô {args.batch}")
+
+    def chunks(items):
+        return [items[i:i + args.batch] for i in range(0, len(items), args.batch)]
+
+    hashes = random_hashes(args.count)
+    report("v1 storeDocument(string)", args.count,
+           *send_all(web3, [v1.functions.storeDocument(h) for h in hashes]))
+    hashes = random_hashes(args.count)
+    report("v1 storeDocuments(string[])", args.count,
+           *send_all(web3, [v1.functions.storeDocuments(chunk) for chunk in chunks(hashes)]))
+
+    hashes = random_hashes(args.count)
+    report("v2 storeDocument(bytes32)", args.count,
+           *send_all(web3, [v2.functions.storeDocument(bytes.fromhex(h)) for h in hashes]))
+    hashes = random_hashes(args.count)
+    keys = [bytes.fromhex(h) for h in hashes]
+    report("v2 storeDocuments(bytes32[])", args.count,
+           *send_all(web3, [v2.functions.storeDocuments(chunk) for chunk in chunks(keys)]))
+
+    # Xác minh: N lần eth_call so với một lần verifyDocuments cho cả danh sách
+    started = time.perf_counter()
+    results = [v2.functions.verifyDocument(key).call() for key in keys]
+    single_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    batch_results = v2.functions.verifyDocuments(keys).call()
+    batch_elapsed = time.perf_counter() - started
+    print(f"v2 verifyDocument x{len(keys)}: {single_elapsed:.3f}s; verifyDocuments: {batch_elapsed:.3f}s; "
+          f"kết quả khớp: {results == list(batch_results)}")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
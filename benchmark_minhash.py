@@ -0,0 +1,61 @@
+# benchmark_minhash.py
+# So sánh thời gian tạo content_hash giữa cách cũ (update từng shingle) và cách theo lô (update_batch).
+# Cách dùng: python benchmark_minhash.py [file.pdf|file.docx|file.txt ...] [--pages 120]
+import random
+import sys
+import time
+from datasketch import MinHash
+from document_analysis import NUM_PERM, compute_minhash, extract_text, get_shingles
+
+WORDS_PER_PAGE = 500
+
+def legacy_shingles(text):
+    words = text.split()
+    return {f"{words[i]} {words[i+1]} {words[i+2]}" for i in range(len(words)-2)}
+
+def legacy_minhash(shingles):
+    m = MinHash(num_perm=NUM_PERM)
+    for s in shingles:
+        m.update(s.encode('utf8'))
+    return m
+
+def synthetic_text(pages, seed=42):
+    rng = random.Random(seed)
+    vocabulary = [f'tu{i}' for i in range(20000)]
+    return ' '.join(rng.choice(vocabulary) for _ in range(pages * WORDS_PER_PAGE))
+
+def timed(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def run(name, text):
+    legacy, legacy_time = timed(lambda: legacy_minhash(legacy_shingles(text)))
+    batched, batched_time = timed(lambda: compute_minhash(get_shingles(text)))
+    identical = (legacy.hashvalues == batched.hashvalues).all()
+    print(f"{name}: {len(text.split())} từ, {len(get_shingles(text))} shingle")
+    print(f"  cũ:     {legacy_time:.3f}s")
+    print(f"  theo lô: {batched_time:.3f}s (nhanh hơn {legacy_time / batched_time:.1f} lần), kết quả giống hệt: {identical}")
+    return identical
+
+def main(argv):
+    pages = 120
+    if '--pages' in argv:
+        pages = int(argv[argv.index('--pages') + 1])
+        del argv[argv.index('--pages'):argv.index('--pages') + 2]
+    ok = run(f'Văn bản tổng hợp {pages} trang', synthetic_text(pages))
+    for path in argv:
+        with open(path, 'rb') as f:
+            text = extract_text(f.read(), path)
+        if text is None:
+            print(f"{path}: không trích xuất được văn bản")
+            continue
+        ok = run(path, text) and ok
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
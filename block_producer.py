@@ -0,0 +1,75 @@
+# block_producer.py
+import threading
+import time
+
+class BlockProducer:
+    """Luồng nền gom các giao dịch đang chờ theo số lượng hoặc khoảng thời gian rồi đào và broadcast block."""
+
+    def __init__(self, blockchain, mine_block, on_block=None, max_batch=100, max_wait=5):
+        self.blockchain = blockchain
+        self.mine_block = mine_block
+        self.on_block = on_block
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.blocks_produced = 0
+        self.last_block_index = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='block-producer', daemon=True)
+        self.thread.start()
+        print(f"Đã khởi động block producer: tối đa {self.max_batch} giao dịch hoặc {self.max_wait}s mỗi block")
+
+    def stop(self):
+        self.stop_event.set()
+        self.notify()
+
+    def notify(self):
+        """Gọi sau khi thêm giao dịch để producer kiểm tra điều kiện đào."""
+        with self.condition:
+            self.condition.notify()
+
+    def _wait_for_batch(self):
+        with self.condition:
+            while not self.blockchain.transactions and not self.stop_event.is_set():
+                self.condition.wait(timeout=1)
+            batch_started = time.time()
+            while (len(self.blockchain.transactions) < self.max_batch
+                   and not self.stop_event.is_set()):
+                remaining = self.max_wait - (time.time() - batch_started)
+                if remaining <= 0:
+                    break
+                self.condition.wait(timeout=remaining)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self._wait_for_batch()
+            if self.stop_event.is_set():
+                break
+            if not self.blockchain.transactions:
+                continue
+            try:
+                pending = len(self.blockchain.transactions)
+                block = self.mine_block()
+                self.blocks_produced += 1
+                self.last_block_index = block['index']
+                print(f"Block producer đã đào block {block['index']} với {pending} giao dịch")
+                if self.on_block:
+                    self.on_block(block)
+            except Exception as e:
+                print(f"Lỗi trong block producer: {str(e)}")
+                time.sleep(1)
+
+    def status(self):
+        return {
+            'pending_transactions': len(self.blockchain.transactions),
+            'max_batch': self.max_batch,
+            'max_wait': self.max_wait,
+            'blocks_produced': self.blocks_produced,
+            'last_block_index': self.last_block_index,
+            'running': bool(self.thread and self.thread.is_alive())
+        }
@@ -1,94 +1,439 @@
-import hashlib
-import json
+import threading
 import time
-import requests
+from p2p import peer_sessions
+from miner import ProofOfWorkMiner, is_proof_valid
+from chain_validation import ChainValidator, compute_block_hash
+
+def get_transaction_document_hash(transaction):
+    """Lấy document_hash từ giao dịch (hỗ trợ cả dạng lồng {'document_hash': {...}} và dạng chuỗi)."""
+    if not isinstance(transaction, dict):
+        return None
+    value = transaction.get('document_hash')
+    if isinstance(value, dict):
+        return value.get('document_hash')
+    return value
+
+def get_transaction_content_hash(transaction):
+    """Lấy content_hash (MinHash) từ giao dịch nếu có."""
+    if not isinstance(transaction, dict):
+        return None
+    value = transaction.get('document_hash')
+    if isinstance(value, dict):
+        return value.get('content_hash') or None
+    return transaction.get('content_hash') or None
+
+def get_transaction_content_hash_version(transaction):
+    """Phiên bản định dạng content_hash của giao dịch, None với giao dịch cũ không có trường version."""
+    if not isinstance(transaction, dict):
+        return None
+    value = transaction.get('document_hash')
+    if isinstance(value, dict):
+        return value.get('version')
+    return transaction.get('version')
 
 class Blockchain:
-    def __init__(self):
-        self.chain = []
+    def __init__(self, sessions=None, store=None, miner=None, difficulty=4, validator=None, pending_ttl=600):
+        self.sessions = sessions or peer_sessions
+        self.store = store
+        self.miner = miner or ProofOfWorkMiner()
+        self.validator = validator or ChainValidator()
+        self.difficulty = difficulty
+        self._chain = []
+        # Chỉ mục document_hash -> (index của block, vị trí giao dịch trong block)
+        self.document_index = {}
+        self._indexed_length = 0
+        # Chỉ mục cho các giao dịch đang chờ (cục bộ và nhận từ peer): document_hash -> giao dịch
+        self.pending_index = {}
+        # Giao dịch nhận từ peer: document_hash -> thời điểm nhận (theo thứ tự nhận).
+        # Node gốc có thể dừng trước khi đào, nên các mục này hết hạn sau pending_ttl giây
+        self.pending_ttl = pending_ttl
+        self.remote_pending = {}
+        # Chỉ giao dịch gửi lên node này mới được node này đào; giao dịch từ peer do node gốc đào
         self.transactions = []
+        self.lock = threading.RLock()
         self.nodes = set()
-        self.create_block(proof=1, previous_hash='0')  # Tạo block genesis
+        # Các chỉ mục phụ (vd. LSH) đăng ký để được báo khi chuỗi thay đổi
+        self.listeners = []
+        # Hash của từng block trong self.chain (cùng vị trí), tính một lần khi block được nhận
+        self.block_hashes = []
+        if store is not None and len(store) > 0:
+            # Khởi động lại từ dữ liệu cục bộ, chỉ cần tải phần đuôi còn thiếu từ peer
+            self._chain, self.block_hashes = store.load_chain()
+            self.rebuild_index()
+        else:
+            self.create_block(proof=1, previous_hash='0')  # Tạo block genesis
+        if store is not None:
+            self._load_pending()
         self.sync_on_init()
 
+    @property
+    def chain(self):
+        return self._chain
+
+    @chain.setter
+    def chain(self, new_chain):
+        # Thay thế toàn bộ chuỗi (replace_chain, sync_on_join, /sync_chain) => xây lại chỉ mục
+        self.set_chain(new_chain)
+
+    def set_chain(self, new_chain, block_hashes=None):
+        """Thay toàn bộ chuỗi, dùng lại block_hashes đã tính khi kiểm tra (nếu có)."""
+        with self.lock:
+            self._chain = new_chain
+            self.block_hashes = list(block_hashes) if block_hashes else []
+            self.rebuild_index()
+            if self.store is not None:
+                self.store.replace_chain(new_chain, self.block_hashes)
+            for listener in self.listeners:
+                listener.on_chain_replaced(new_chain)
+                self._replay_pending(listener)
+
+    def rebuild_index(self):
+        self.document_index = {}
+        self._indexed_length = 0
+        self._index_new_blocks(notify=False)
+        print(f"Đã xây lại chỉ mục tài liệu: {len(self.document_index)} document_hash")
+
+    def _index_block(self, block):
+        for position, transaction in enumerate(block.get('transactions', [])):
+            document_hash = get_transaction_document_hash(transaction)
+            if document_hash and document_hash not in self.document_index:
+                self.document_index[document_hash] = (block['index'], position)
+
+    def _index_new_blocks(self, notify=True):
+        # Bắt kịp các block được append trực tiếp vào self.chain mà chưa qua append_block.
+        # Được gọi cả từ luồng đọc nên phải giữ self.lock khi sửa block_hashes/document_index
+        with self.lock:
+            del self.block_hashes[len(self._chain):]
+            while self._indexed_length < len(self._chain):
+                position = self._indexed_length
+                block = self._chain[position]
+                if position >= len(self.block_hashes):
+                    self.block_hashes.append(self.hash_block(block))
+                elif self.block_hashes[position] is None:
+                    self.block_hashes[position] = self.hash_block(block)
+                self._index_block(block)
+                self._indexed_length += 1
+                if notify:
+                    if self.store is not None:
+                        self.store.append_block(block, self.block_hashes[position])
+                    for listener in self.listeners:
+                        listener.on_block_added(block)
+
+    def add_listener(self, listener):
+        """Đăng ký chỉ mục phụ có on_block_added(block) và on_chain_replaced(chain)."""
+        with self.lock:
+            self.listeners.append(listener)
+            listener.on_chain_replaced(self._chain)
+            self._replay_pending(listener)
+
+    def _replay_pending(self, listener):
+        # Giao dịch đang chờ không nằm trong chuỗi, báo lại sau khi chỉ mục phụ được xây lại
+        if hasattr(listener, 'on_transaction_added'):
+            for transaction in self.pending_index.values():
+                listener.on_transaction_added(transaction)
+
+    def append_block(self, block, block_hash=None):
+        """Thêm block vào cuối chuỗi và cập nhật chỉ mục (block_hash: hash đã kiểm tra, nếu có)."""
+        with self.lock:
+            self._index_new_blocks()
+            self._chain.append(block)
+            if block_hash is not None:
+                self.block_hashes.append(block_hash)
+            self._index_new_blocks()
+            for transaction in block.get('transactions', []):
+                document_hash = get_transaction_document_hash(transaction)
+                self.pending_index.pop(document_hash, None)
+                self.remote_pending.pop(document_hash, None)
+        return block
+
+    def get_block_hash(self, position):
+        """Hash của block thứ position (0-based) trong chuỗi cục bộ, không serialize lại."""
+        with self.lock:
+            self._index_new_blocks()
+            return self.block_hashes[position]
+
+    def tip_hash(self):
+        with self.lock:
+            return self.get_block_hash(len(self._chain) - 1)
+
     def sync_on_init(self):
         if len(self.nodes) > 0:
             print("Thực hiện đồng bộ chuỗi khi khởi tạo")
             self.replace_chain()
 
     def sync_on_join(self, node_url):
+        # Chỉ tải phần đuôi chuỗi còn thiếu; tự quay về tải toàn bộ nếu lệch nhánh
+        return self.sync_delta(node_url)
+
+    def sync_if_longer(self, node_url):
+        """Tải chuỗi từ node_url và chỉ thay thế khi chuỗi đó hợp lệ và dài hơn chuỗi cục bộ."""
         try:
-            response = requests.get(f'{node_url}/get_chain', timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if self.is_chain_valid(data['chain']):
-                    self.chain = data['chain']
-                    print(f"Đã đồng bộ chuỗi từ {node_url}: length={data['length']}")
-                    return True
-                else:
-                    print(f"Chuỗi từ {node_url} không hợp lệ")
-                    return False
-            else:
+            response = self.sessions.get(f'{node_url}/get_chain', timeout=10)
+            if response.status_code != 200:
                 print(f"Phản hồi không thành công từ {node_url}: {response.status_code}")
                 return False
+            new_chain = response.json()['chain']
+            if len(new_chain) <= len(self.chain):
+                print(f"Chuỗi từ {node_url} không dài hơn chuỗi cục bộ, bỏ qua")
+                return False
+            hashes = []
+            if not self.is_chain_valid(new_chain, hashes):
+                print(f"Chuỗi từ {node_url} không hợp lệ")
+                return False
+            self.set_chain(new_chain, hashes)
+            print(f"Đã đồng bộ chuỗi từ {node_url}: length={len(new_chain)}")
+            return True
         except Exception as e:
             print(f"Lỗi khi đồng bộ từ {node_url}: {str(e)}")
             return False
 
-    def create_block(self, proof, previous_hash):
-        block = {
-            'index': len(self.chain) + 1,
-            'timestamp': time.time(),
-            'transactions': self.transactions,
-            'proof': proof,
-            'previous_hash': previous_hash
+    def sync_delta(self, node_url, page_size=500):
+        """Chỉ tải các block sau tip cục bộ qua /get_blocks và kiểm tra phần đuôi mới."""
+        fetched = 0
+        try:
+            while True:
+                tip = self.get_previous_block()
+                response = self.sessions.get(
+                    f'{node_url}/get_blocks',
+                    params={'start': tip['index'], 'limit': page_size},
+                    timeout=10
+                )
+                if response.status_code != 200:
+                    print(f"{node_url} không hỗ trợ tải theo độ cao ({response.status_code}), tải toàn bộ chuỗi")
+                    return self.sync_if_longer(node_url)
+                data = response.json()
+                blocks = data['blocks']
+                if not blocks:
+                    break
+                if blocks[0]['previous_hash'] != self.tip_hash():
+                    print(f"Chuỗi của {node_url} lệch nhánh tại block {tip['index']}, tải toàn bộ chuỗi")
+                    return self.sync_if_longer(node_url)
+                if not self.extend_chain(blocks):
+                    print(f"Các block mới từ {node_url} không hợp lệ")
+                    return fetched > 0
+                fetched += len(blocks)
+                if len(self.chain) >= data['length']:
+                    break
+        except Exception as e:
+            print(f"Lỗi khi đồng bộ theo độ cao từ {node_url}: {str(e)}")
+            return fetched > 0
+        if fetched:
+            print(f"Đã tải {fetched} block mới từ {node_url}: length={len(self.chain)}")
+        return fetched > 0
+
+    def get_blocks(self, start, limit):
+        """Các block có index > start, tối đa limit block."""
+        return self.chain[start:start + limit]
+
+    def is_suffix_valid(self, blocks, anchor_block, anchor_hash=None, hashes=None):
+        """Kiểm tra các block nối tiếp anchor_block mà không duyệt lại phần chuỗi đã có."""
+        error, reason, computed = self.validator.validate(
+            [anchor_block] + list(blocks), self.difficulty, anchor_hash, check_index=True
+        )
+        if error is not None:
+            self._print_invalid(reason, blocks[error - 1]['index'])
+            return False
+        if hashes is not None:
+            hashes[:] = computed[1:]
+        return True
+
+    def _print_invalid(self, reason, position):
+        messages = {
+            'index': 'index không liên tục',
+            'previous_hash': 'previous_hash không khớp',
+            'proof': 'proof không hợp lệ'
         }
-        self.transactions = []
-        self.chain.append(block)
+        print(f"Chuỗi không hợp lệ: {messages[reason]} tại block {position}")
+
+    def extend_chain(self, blocks):
+        """Nối các block mới vào tip cục bộ sau khi kiểm tra (kiểm tra và nối cùng một lần giữ khóa)."""
+        if not blocks:
+            return True
+        with self.lock:
+            hashes = []
+            if not self.is_suffix_valid(blocks, self.get_previous_block(), self.tip_hash(), hashes):
+                return False
+            for block, block_hash in zip(blocks, hashes):
+                self.append_block(block, block_hash)
+        return True
+
+    def merge_chain(self, new_chain):
+        """Nhận chuỗi đầy đủ từ peer: nếu chung tip với chuỗi cục bộ thì chỉ kiểm tra phần đuôi."""
+        local_length = len(self.chain)
+        if len(new_chain) <= local_length:
+            return False
+        if self.hash_block(new_chain[local_length - 1]) == self.tip_hash():
+            return self.extend_chain(new_chain[local_length:])
+        hashes = []
+        if not self.is_chain_valid(new_chain, hashes):
+            return False
+        self.set_chain(new_chain, hashes)
+        return True
+
+    def create_block(self, proof, previous_hash=None, previous_block=None):
+        """Tạo block từ các giao dịch đang chờ.
+
+        previous_block: tip mà proof được đào trên đó; nếu tip đã đổi thì trả về None để đào lại.
+        """
+        with self.lock:
+            if previous_block is not None:
+                if self._chain[-1] is not previous_block:
+                    return None
+                previous_hash = self.tip_hash()
+            block = {
+                'index': len(self.chain) + 1,
+                'timestamp': time.time(),
+                'transactions': self.transactions,
+                'proof': proof,
+                'previous_hash': previous_hash
+            }
+            self.transactions = []
+            self.append_block(block)
+            if self.store is not None:
+                self.store.remove_pending([get_transaction_document_hash(t) for t in block['transactions']])
         print(f"Đã tạo block mới: index={block['index']}, timestamp={block['timestamp']}")
         return block
 
     def add_transaction(self, document_hash):
-        self.transactions.append({'document_hash': document_hash})
+        with self.lock:
+            transaction = {'document_hash': document_hash}
+            self.transactions.append(transaction)
+            if self.store is not None:
+                self.store.add_pending(get_transaction_document_hash(transaction), transaction)
+            self._track_pending(transaction)
         index = self.chain[-1]['index'] + 1
         print(f"Đã thêm giao dịch: document_hash={document_hash}, index={index}")
         return index
 
+    def add_remote_transaction(self, document_hash):
+        """Ghi nhận giao dịch do peer khác đào (để chặn trùng lặp) mà không đưa vào block của node này."""
+        transaction = {'document_hash': document_hash}
+        pending_hash = get_transaction_document_hash(transaction)
+        with self.lock:
+            self.expire_pending()
+            if pending_hash and pending_hash not in self.pending_index and pending_hash not in self.document_index:
+                self.remote_pending[pending_hash] = time.time()
+            self._track_pending(transaction)
+        print(f"Đã ghi nhận giao dịch từ peer: document_hash={document_hash}")
+        return self.chain[-1]['index'] + 1
+
+    def _track_pending(self, transaction):
+        pending_hash = get_transaction_document_hash(transaction)
+        if pending_hash and pending_hash not in self.document_index:
+            self.pending_index.setdefault(pending_hash, transaction)
+        for listener in self.listeners:
+            if hasattr(listener, 'on_transaction_added'):
+                listener.on_transaction_added(transaction)
+
+    def expire_pending(self):
+        """Bỏ các giao dịch từ peer đã chờ quá pending_ttl mà chưa vào block; trả về số giao dịch bị bỏ."""
+        expired = []
+        with self.lock:
+            now = time.time()
+            for document_hash, received_at in list(self.remote_pending.items()):
+                if now - received_at < self.pending_ttl:
+                    break
+                del self.remote_pending[document_hash]
+                transaction = self.pending_index.pop(document_hash, None)
+                if transaction is not None:
+                    expired.append(transaction)
+            for transaction in expired:
+                for listener in self.listeners:
+                    if hasattr(listener, 'on_transaction_expired'):
+                        listener.on_transaction_expired(transaction)
+        if expired:
+            print(f"Đã bỏ {len(expired)} giao dịch từ peer quá {self.pending_ttl}s chưa được đào")
+        return len(expired)
+
+    def _load_pending(self):
+        # Giao dịch cục bộ chưa kịp đào trước lần dừng trước; bỏ các giao dịch đã nằm trong chuỗi
+        confirmed = []
+        for document_hash, transaction in self.store.load_pending():
+            if document_hash in self.document_index:
+                confirmed.append(document_hash)
+                continue
+            self.transactions.append(transaction)
+            self._track_pending(transaction)
+        if confirmed:
+            self.store.remove_pending(confirmed)
+        if self.transactions:
+            print(f"Đã nạp lại {len(self.transactions)} giao dịch đang chờ đào")
+
+    def transaction_status(self, document_hash):
+        """'confirmed' kèm vị trí, 'pending' hoặc None nếu node không biết giao dịch."""
+        self.expire_pending()
+        location = self.find_document(document_hash)
+        if location:
+            return {'status': 'confirmed', 'block_index': location[0], 'position': location[1]}
+        if document_hash in self.pending_index:
+            return {'status': 'pending'}
+        return None
+
     def get_previous_block(self):
         return self.chain[-1]
 
     def proof_of_work(self, previous_proof):
-        new_proof = 1
-        difficulty = 4
-        target = '0' * difficulty
-        while hashlib.sha256(str(new_proof**2 - previous_proof**2).encode()).hexdigest()[:difficulty] != target:
-            new_proof += 1
+        """Trả về proof, hoặc None nếu lượt đào bị hủy do có block cạnh tranh."""
+        new_proof = self.miner.mine(previous_proof, self.difficulty)
+        if new_proof is None:
+            print("Lượt đào bị hủy")
+            return None
         print(f"Đã tìm thấy proof: {new_proof}")
         return new_proof
 
     def is_valid_proof(self, proof, previous_proof):
-        hash_operation = hashlib.sha256(str(proof**2 - previous_proof**2).encode()).hexdigest()
-        difficulty = 4
-        target = '0' * difficulty
-        is_valid = hash_operation[:difficulty] == target
-        print(f"Kiểm tra proof: {'Hợp lệ' if is_valid else 'Không hợp lệ'}, hash={hash_operation}")
-        return is_valid
+        return is_proof_valid(proof, previous_proof, self.difficulty)
 
     def hash_block(self, block):
-        encoded_block = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(encoded_block).hexdigest()
-
-    def is_chain_valid(self, chain):
-        for i in range(1, len(chain)):
-            block = chain[i]
-            previous_block = chain[i-1]
-            if block['previous_hash'] != self.hash_block(previous_block):
-                print(f"Chuỗi không hợp lệ: previous_hash không khớp tại block {i}")
-                return False
-            if not self.is_valid_proof(block['proof'], previous_block['proof']):
-                print(f"Chuỗi không hợp lệ: proof không hợp lệ tại block {i}")
+        return compute_block_hash(block)
+
+    def _matching_prefix_length(self, chain):
+        """Số block đầu của chain trùng với chuỗi cục bộ (so hash, tìm nhị phân)."""
+        self._index_new_blocks()
+        limit = min(len(chain), len(self._chain))
+
+        def matches(length):
+            position = length - 1
+            return chain[position] is self._chain[position] or self.hash_block(chain[position]) == self.block_hashes[position]
+
+        if limit == 0 or matches(limit):
+            return limit
+        low, high = 0, limit - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if matches(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def is_chain_valid(self, chain, hashes=None):
+        # Phần đầu trùng với chuỗi cục bộ đã được kiểm tra trước đó nên chỉ kiểm tra phần lệch.
+        # Phần đầu đó được thay bằng chính các block cục bộ để chain nhận về không thể mang nội dung khác.
+        if not chain:
+            print("Chuỗi hợp lệ")
+            return True
+        prefix = self._matching_prefix_length(chain)
+        if prefix:
+            # Tìm nhị phân chỉ so hash ở vài vị trí: block bị sửa nằm trước block trùng hash vẫn phải bị từ chối.
+            # So sánh dict rẻ hơn nhiều so với serialize và băm lại từng block
+            if chain[:prefix] != self._chain[:prefix]:
+                position = next(i for i in range(prefix) if chain[i] != self._chain[i])
+                print(f"Chuỗi không hợp lệ: block {position + 1} khác chuỗi cục bộ dù block {prefix} trùng hash")
                 return False
-        print("Chuỗi hợp lệ")
+            chain[:prefix] = self._chain[:prefix]
+            anchor = prefix - 1
+            anchor_hash = self.block_hashes[anchor]
+        else:
+            anchor = 0
+            anchor_hash = None
+        error, reason, computed = self.validator.validate(chain[anchor:], self.difficulty, anchor_hash)
+        if error is not None:
+            self._print_invalid(reason, anchor + error)
+            return False
+        if hashes is not None:
+            hashes[:] = self.block_hashes[:anchor] + computed
+        print(f"Chuỗi hợp lệ: dùng lại {prefix} block đã kiểm tra, kiểm tra {len(chain) - prefix} block mới")
         return True
 
     def add_node(self, node_url):
@@ -107,59 +452,36 @@ class Blockchain:
     #                 return True
     #     print(f"Không tìm thấy document_hash {document_hash}")
     #     return False
-    def verify_document(self, document_hash):
-        for block in self.chain:
-            for transaction in block['transactions']:
-                # Kiểm tra nếu transaction là một dict chứa 'document_hash'
-                if isinstance(transaction, dict):
-                    # Lấy giá trị 'document_hash' bên trong dictionary
-                    inner_document_hash = transaction.get('document_hash', {}).get('document_hash')
-                    if inner_document_hash == document_hash:
-                        print(f"Tìm thấy document_hash {document_hash} trong block {block['index']}")
-                        return True
+    def find_document(self, document_hash):
+        """Trả về (index của block, vị trí giao dịch) nếu document_hash đã có trong chuỗi, ngược lại None."""
+        with self.lock:
+            self._index_new_blocks()
+            return self.document_index.get(document_hash)
+
+    def verify_document(self, document_hash, include_pending=False):
+        location = self.find_document(document_hash)
+        if location:
+            print(f"Tìm thấy document_hash {document_hash} trong block {location[0]}")
+            return True
+        if include_pending:
+            self.expire_pending()
+            if document_hash in self.pending_index:
+                print(f"Tìm thấy document_hash {document_hash} trong giao dịch đang chờ")
+                return True
         print(f"Không tìm thấy document_hash {document_hash}")
         return False
+
     def replace_chain(self):
         if len(self.chain) > 1:
             print("Chuỗi hiện tại đã có dữ liệu, không đồng bộ")
             return False
 
-        # Ưu tiên đồng bộ từ bootstrap node
+        # Ưu tiên đồng bộ từ bootstrap node, sau đó thử các node khác
         bootstrap_url = "http://192.168.1.8:5000"
-        try:
-            response = requests.get(f'{bootstrap_url}/get_chain', timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if self.is_chain_valid(data['chain']):
-                    self.chain = data['chain']
-                    print(f"Đã đồng bộ chuỗi từ bootstrap node {bootstrap_url}: length={data['length']}")
-                    return True
-                else:
-                    print(f"Chuỗi từ {bootstrap_url} không hợp lệ")
-            else:
-                print(f"Phản hồi không thành công từ {bootstrap_url}: {response.status_code}")
-        except Exception as e:
-            print(f"Lỗi khi đồng bộ từ {bootstrap_url}: {str(e)}")
-
-        # Thử các node khác nếu bootstrap node thất bại
-        for node in self.nodes:
-            if node == bootstrap_url:
-                continue
-            try:
-                response = requests.get(f'{node}/get_chain', timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    if self.is_chain_valid(data['chain']):
-                        self.chain = data['chain']
-                        print(f"Đã đồng bộ chuỗi từ {node}: length={data['length']}")
-                        return True
-                    else:
-                        print(f"Chuỗi từ {node} không hợp lệ")
-                else:
-                    print(f"Phản hồi không thành công từ {node}: {response.status_code}")
-            except Exception as e:
-                print(f"Lỗi khi đồng bộ từ {node}: {str(e)}")
-                continue
+        candidates = [bootstrap_url] + [node for node in self.nodes if node != bootstrap_url]
+        for node in candidates:
+            if self.sync_delta(node):
+                return True
 
         print("Không thể đồng bộ chuỗi từ bất kỳ node nào")
         return False
\ No newline at end of file
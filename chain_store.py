@@ -0,0 +1,116 @@
+# chain_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class ChainStore:
+    """Lưu chuỗi block xuống SQLite (chế độ WAL) để node khởi động lại từ dữ liệu cục bộ."""
+
+    def __init__(self, path, checkpoint_every=100):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.appended_since_checkpoint = 0
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS blocks (block_index INTEGER PRIMARY KEY, data TEXT NOT NULL, hash TEXT)')
+        # File tạo trước khi có cột hash: thêm cột, hash sẽ được tính lại khi nạp
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(blocks)')]
+        if 'hash' not in columns:
+            self.conn.execute('ALTER TABLE blocks ADD COLUMN hash TEXT')
+        # Giao dịch cục bộ chưa được đào, để node khởi động lại vẫn đào tiếp
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pending_transactions (document_hash TEXT PRIMARY KEY, data TEXT NOT NULL, added_at REAL NOT NULL)')
+        self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM blocks').fetchone()[0]
+
+    def load_chain(self):
+        """Trả về (chain, hashes); hash có thể là None với dữ liệu cũ."""
+        with self.lock:
+            rows = self.conn.execute('SELECT data, hash FROM blocks ORDER BY block_index').fetchall()
+        chain = [json.loads(row[0]) for row in rows]
+        hashes = [row[1] for row in rows]
+        print(f"Đã nạp {len(chain)} block từ {self.path}")
+        return chain, hashes
+
+    def append_block(self, block, block_hash):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO blocks (block_index, data, hash) VALUES (?, ?, ?)',
+                (block['index'], json.dumps(block, sort_keys=True), block_hash)
+            )
+            self.conn.commit()
+            self.appended_since_checkpoint += 1
+            if self.appended_since_checkpoint >= self.checkpoint_every:
+                self._checkpoint()
+
+    def replace_chain(self, chain, hashes):
+        # Thay chuỗi là thao tác hiếm (lệch nhánh), ghi lại toàn bộ trong một transaction
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM blocks')
+                self.conn.executemany(
+                    'INSERT INTO blocks (block_index, data, hash) VALUES (?, ?, ?)',
+                    [(block['index'], json.dumps(block, sort_keys=True), block_hash)
+                     for block, block_hash in zip(chain, hashes)]
+                )
+            self._checkpoint()
+        print(f"Đã ghi lại {len(chain)} block vào {self.path}")
+
+    def add_pending(self, document_hash, transaction):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pending_transactions (document_hash, data, added_at) VALUES (?, ?, ?)',
+                (document_hash, json.dumps(transaction, sort_keys=True), time.time())
+            )
+            self.conn.commit()
+
+    def remove_pending(self, document_hashes):
+        if not document_hashes:
+            return
+        with self.lock:
+            self.conn.executemany(
+                'DELETE FROM pending_transactions WHERE document_hash = ?',
+                [(document_hash,) for document_hash in document_hashes]
+            )
+            self.conn.commit()
+
+    def load_pending(self):
+        """Trả về [(document_hash, giao dịch)] theo thứ tự được thêm."""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT document_hash, data FROM pending_transactions ORDER BY added_at, rowid'
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def _checkpoint(self):
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.appended_since_checkpoint = 0
+
+    def checkpoint(self):
+        """Gộp WAL vào file chính để lần khởi động sau nạp nhanh."""
+        with self.lock:
+            self._checkpoint()
+
+    def snapshot(self, dest_path):
+        """Sao lưu nhất quán toàn bộ chuỗi sang file SQLite khác."""
+        with self.lock:
+            dest = sqlite3.connect(dest_path)
+            try:
+                self.conn.backup(dest)
+            finally:
+                dest.close()
+        print(f"Đã tạo snapshot chuỗi tại {dest_path}")
+
+    def close(self):
+        with self.lock:
+            self._checkpoint()
+            self.conn.close()
@@ -0,0 +1,80 @@
+# chain_sync.py
+import threading
+import time
+
+class ChainSyncService:
+    """Luồng nền theo dõi độ dài chuỗi của các peer và chỉ tải chuỗi khi có peer dài hơn."""
+
+    def __init__(self, blockchain, node_registry, sessions, interval=15, timeout=10):
+        self.blockchain = blockchain
+        self.node_registry = node_registry
+        self.sessions = sessions
+        self.interval = interval
+        self.timeout = timeout
+        self.current_node_url = None
+        # peer -> {'length': ..., 'checked_at': ...}
+        self.peer_heights = {}
+        self.last_sync = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, current_node_url=None):
+        self.current_node_url = current_node_url
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='chain-sync', daemon=True)
+        self.thread.start()
+        print(f"Đã khởi động dịch vụ đồng bộ chuỗi, chu kỳ {self.interval}s")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sync_once()
+                # Bỏ giao dịch từ peer mà node gốc không còn đào (vd. node gốc đã dừng)
+                self.blockchain.expire_pending()
+            except Exception as e:
+                print(f"Lỗi trong dịch vụ đồng bộ chuỗi: {str(e)}")
+            self.stop_event.wait(self.interval)
+
+    def poll_heights(self):
+        """Hỏi độ dài chuỗi của từng peer qua /chain_height (rẻ hơn nhiều so với /get_chain)."""
+        for peer in self.node_registry.get_peers():
+            if peer == self.current_node_url:
+                continue
+            try:
+                response = self.sessions.get(f'{peer}/chain_height', timeout=self.timeout)
+                if response.status_code == 200:
+                    self.peer_heights[peer] = {
+                        'length': response.json()['length'],
+                        'checked_at': time.time()
+                    }
+            except Exception as e:
+                print(f"Không lấy được độ dài chuỗi từ {peer}: {str(e)}")
+                self.peer_heights.pop(peer, None)
+        return self.peer_heights
+
+    def sync_once(self):
+        """Chỉ tải phần đuôi còn thiếu từ peer dài nhất khi peer đó dài hơn chuỗi cục bộ."""
+        heights = self.poll_heights()
+        local_length = len(self.blockchain.chain)
+        ahead = sorted(
+            ((info['length'], peer) for peer, info in heights.items() if info['length'] > local_length),
+            reverse=True
+        )
+        for length, peer in ahead:
+            print(f"Peer {peer} đi trước: length={length} > {local_length}, bắt đầu đồng bộ")
+            if self.blockchain.sync_delta(peer):
+                self.last_sync = time.time()
+                return True
+        return False
+
+    def status(self):
+        return {
+            'local_length': len(self.blockchain.chain),
+            'peer_heights': self.peer_heights,
+            'last_sync': self.last_sync,
+            'running': bool(self.thread and self.thread.is_alive())
+        }
@@ -0,0 +1,60 @@
+# chain_validation.py
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from miner import is_proof_valid
+
+def compute_block_hash(block):
+    encoded_block = json.dumps(block, sort_keys=True).encode()
+    return hashlib.sha256(encoded_block).hexdigest()
+
+def validate_segment(blocks, difficulty, anchor_hash=None, check_index=False):
+    """Kiểm tra blocks[1:] nối tiếp blocks[0] (block neo).
+
+    Trả về (vị trí lỗi hoặc None, lý do, hashes của các block đã kiểm tra kể cả block neo).
+    """
+    hashes = [anchor_hash or compute_block_hash(blocks[0])]
+    for i in range(1, len(blocks)):
+        block = blocks[i]
+        previous_block = blocks[i-1]
+        if check_index and block['index'] != previous_block['index'] + 1:
+            return i, 'index', hashes
+        if block['previous_hash'] != hashes[i-1]:
+            return i, 'previous_hash', hashes
+        if not is_proof_valid(block['proof'], previous_block['proof'], difficulty):
+            return i, 'proof', hashes
+        hashes.append(compute_block_hash(block))
+    return None, None, hashes
+
+class ChainValidator:
+    """Kiểm tra hash và proof của một đoạn chuỗi, chia thành nhiều phần chạy song song khi đoạn đủ dài."""
+
+    def __init__(self, workers=None, min_parallel_blocks=2000, chunk_size=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_parallel_blocks = min_parallel_blocks
+        self.chunk_size = chunk_size
+
+    def validate(self, blocks, difficulty, anchor_hash=None, check_index=False):
+        if self.workers <= 1 or len(blocks) < self.min_parallel_blocks:
+            return validate_segment(blocks, difficulty, anchor_hash, check_index)
+
+        # Mỗi phần lấy thêm block cuối của phần trước làm neo để kiểm tra cả liên kết giữa các phần
+        starts = list(range(0, len(blocks) - 1, self.chunk_size))
+        segments = [blocks[start:start + self.chunk_size + 1] for start in starts]
+        anchors = [anchor_hash] + [None] * (len(segments) - 1)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(
+                validate_segment,
+                segments,
+                [difficulty] * len(segments),
+                anchors,
+                [check_index] * len(segments)
+            ))
+
+        hashes = [results[0][2][0]]
+        for start, (error, reason, segment_hashes) in zip(starts, results):
+            hashes.extend(segment_hashes[1:])
+            if error is not None:
+                return start + error, reason, hashes
+        return None, None, hashes
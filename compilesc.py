@@ -1,19 +1,29 @@
+import os
 import solcx
 import json
 
 # Cài đặt Solidity Compiler (chỉ cần chạy một lần)
 solcx.install_solc("0.8.29")
 
-# Biên dịch Smart Contract
-compiled_sol = solcx.compile_files(["D:/1.WorkspacePython/document_verification/DocumentStorage.sol"])
-contract_interface = compiled_sol["DocumentStorage.sol:DocumentStorage"]
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Lưu ABI vào file JSON
-with open("compiled_abi.json", "w") as abi_file:
-    json.dump(contract_interface["abi"], abi_file)
+# (file .sol, tên contract, hậu tố file ABI/Bytecode)
+CONTRACTS = [
+    ("DocumentStorage.sol", "DocumentStorage", ""),
+    ("DocumentStorageV2.sol", "DocumentStorageV2", "_v2"),
+]
 
-# Lưu Bytecode vào file JSON
-with open("compiled_bytecode.json", "w") as bytecode_file:
-    bytecode_file.write(contract_interface["bin"])
+for source, name, suffix in CONTRACTS:
+    # Biên dịch Smart Contract
+    compiled_sol = solcx.compile_files([os.path.join(BASE_DIR, source)], solc_version="0.8.29")
+    contract_interface = next(value for key, value in compiled_sol.items() if key.endswith(f":{name}"))
 
-print("Biên dịch thành công! ABI và Bytecode đã được lưu.")
+    # Lưu ABI vào file JSON
+    with open(os.path.join(BASE_DIR, f"compiled_abi{suffix}.json"), "w") as abi_file:
+        json.dump(contract_interface["abi"], abi_file)
+
+    # Lưu Bytecode vào file JSON
+    with open(os.path.join(BASE_DIR, f"compiled_bytecode{suffix}.json"), "w") as bytecode_file:
+        bytecode_file.write(contract_interface["bin"])
+
+    print(f"Biên dịch {name} thành công! ABI và Bytecode đã được lưu.")
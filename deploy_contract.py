@@ -1,15 +1,23 @@
 from web3 import Web3
 import json
+import os
+import sys
+
+# Chọn phiên bản contract: python deploy_contract.py [v1|v2] (mặc định v1)
+# v1 = DocumentStorage (khóa string), v2 = DocumentStorageV2 (khóa bytes32)
+version = sys.argv[1] if len(sys.argv) > 1 else "v1"
+suffix = "_v2" if version == "v2" else ""
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Kết nối đến Ethereum Private Network (Ganache hoặc Geth)
 web3 = Web3(Web3.HTTPProvider("http://127.0.0.1:8545/"))
 web3.eth.default_account = web3.eth.accounts[0]
 
-# Đọc Smart Contract đã biên dịch (ABI & Bytecode)
-with open("H:\HK8\Python\project\document_verification\compiled_abi.json") as f:
+# Đọc Smart Contract đã biên dịch (ABI & Bytecode) bởi compilesc.py
+with open(os.path.join(BASE_DIR, f"compiled_abi{suffix}.json")) as f:
     abi = json.load(f)
 
-with open("H:\HK8\Python\project\document_verification\compiled_bytecode.json") as f:
+with open(os.path.join(BASE_DIR, f"compiled_bytecode{suffix}.json")) as f:
     bytecode = f.read()
 
 # Deploy Contract
@@ -19,4 +27,6 @@ tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
 
 # Lưu địa chỉ contract
 contract_address = tx_receipt.contractAddress
-print(f"Smart Contract deployed at: {contract_address}")
+print(f"Smart Contract {version} deployed at: {contract_address}")
+if version == "v2":
+    print("Đặt CONTRACT_VERSION = 2 và contract_address trong app_update_similar_hash.py để dùng contract này")
@@ -0,0 +1,211 @@
+# document_analysis.py
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import unicodedata
+from functools import cached_property
+import pdfplumber
+from docx import Document
+import numpy as np
+from datasketch import MinHash
+
+NUM_PERM = 128
+# Phiên bản định dạng content_hash trong giao dịch:
+# 1 = "n1,n2,..." thập phân (~1.3 KB), 2 = base64 của các giá trị uint32 little-endian (~0.7 KB)
+CONTENT_HASH_DECIMAL = 1
+CONTENT_HASH_BASE64 = 2
+CONTENT_HASH_VERSION = CONTENT_HASH_BASE64
+TEXT_EXTENSIONS = ['.txt', '.md']
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + ['.pdf', '.docx']
+
+def normalize_text(text):
+    """Chuẩn hóa văn bản trước khi tạo MinHash."""
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    text = text.lower()
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s]', '', text)
+    return text.strip()
+
+def _as_source(file_content):
+    # bytes => đọc trong bộ nhớ; còn lại là đường dẫn tới file đã spool, pdfplumber/python-docx đọc trực tiếp
+    return io.BytesIO(file_content) if isinstance(file_content, (bytes, bytearray)) else file_content
+
+def extract_text(file_content, filename):
+    """Trích xuất văn bản từ file (file_content là bytes hoặc đường dẫn tới file đã spool)."""
+    if any(filename.lower().endswith(ext) for ext in SUPPORTED_EXTENSIONS):
+        try:
+            text = ""
+            if filename.lower().endswith('.txt') or filename.lower().endswith('.md'):
+                if isinstance(file_content, (bytes, bytearray)):
+                    text = file_content.decode('utf-8', errors='ignore')
+                else:
+                    with open(file_content, 'r', encoding='utf-8', errors='ignore') as f:
+                        text = f.read()
+            elif filename.lower().endswith('.pdf'):
+                with pdfplumber.open(_as_source(file_content)) as pdf:
+                    for page in pdf.pages:
+                        page_text = page.extract_text() or ""
+                        text += page_text
+            elif filename.lower().endswith('.docx'):
+                doc = Document(_as_source(file_content))
+                for para in doc.paragraphs:
+                    text += para.text + "\n"
+            text = normalize_text(text)
+            if not text:
+                print(f"Không trích xuất được văn bản từ {filename}: Văn bản rỗng hoặc chỉ chứa khoảng trắng")
+                return None
+            print(f"Trích xuất văn bản từ {filename}: {text[:50]}...")
+            return text
+        except Exception as e:
+            print(f"Lỗi khi trích xuất văn bản từ {filename}: {str(e)}")
+            return None
+    print(f"Định dạng file {filename} không được hỗ trợ")
+    return None
+
+# Số shingle băm trong mỗi lô update_batch; mỗi lô cấp phát một ma trận MINHASH_BATCH_SIZE x NUM_PERM uint64
+MINHASH_BATCH_SIZE = 8192
+
+def get_shingles(text):
+    """Tạo tập shingle 3 từ từ văn bản đã chuẩn hóa."""
+    if not text:
+        return set()
+    words = text.split()
+    return set(map(' '.join, zip(words, words[1:], words[2:])))
+
+def compute_minhash(shingles, batch_size=MINHASH_BATCH_SIZE):
+    """MinHash của tập shingle, áp dụng hoán vị theo lô bằng NumPy (kết quả giống hệt update từng shingle)."""
+    m = MinHash(num_perm=NUM_PERM)
+    if not hasattr(m, 'update_batch'):
+        for s in shingles:
+            m.update(s.encode('utf8'))
+        return m
+    batch = []
+    for s in shingles:
+        batch.append(s.encode('utf8'))
+        if len(batch) >= batch_size:
+            m.update_batch(batch)
+            batch = []
+    if batch:
+        m.update_batch(batch)
+    return m
+
+def encode_content_hash(hashvalues, version=CONTENT_HASH_VERSION):
+    """Mã hóa hashvalues của MinHash thành content_hash theo phiên bản định dạng."""
+    if version == CONTENT_HASH_DECIMAL:
+        return ','.join(map(str, hashvalues))
+    values = np.asarray(hashvalues, dtype=np.uint64)
+    # datasketch giới hạn hashvalues trong 32 bit; nếu vượt thì đóng gói uint64
+    dtype = '<u4' if values.max(initial=0) <= 0xFFFFFFFF else '<u8'
+    return base64.b64encode(values.astype(dtype).tobytes()).decode('ascii')
+
+def content_hash_version(data):
+    """Phiên bản content_hash của giao dịch/request (dict hoặc form); None nếu không có trường version."""
+    value = data.get('version')
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+def decode_content_hash(content_hash, version, num_perm=NUM_PERM):
+    """Giải mã content_hash theo version của giao dịch thành mảng uint64, trả về None nếu không hợp lệ.
+
+    version None (giao dịch cũ không có trường version) được hiểu là dạng thập phân.
+    """
+    if not content_hash:
+        return None
+    if version is None or version == CONTENT_HASH_DECIMAL:
+        try:
+            values = [int(x.strip()) for x in content_hash.split(',') if x.strip()]
+        except ValueError:
+            return None
+        if len(values) != num_perm:
+            return None
+        return np.array(values, dtype=np.uint64)
+    if version != CONTENT_HASH_BASE64:
+        return None
+    try:
+        raw = base64.b64decode(content_hash, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) == num_perm * 4:
+        return np.frombuffer(raw, dtype='<u4').astype(np.uint64)
+    if len(raw) == num_perm * 8:
+        return np.frombuffer(raw, dtype='<u8').astype(np.uint64)
+    return None
+
+class AnalyzedDocument:
+    """Tài liệu tải lên trong một request: mỗi bước phân tích chỉ được tính một lần, khi cần."""
+
+    def __init__(self, content, filename, cache=None, spool=None):
+        self.content = content
+        self.filename = filename
+        self.cache = cache
+        # spool: UploadSpool đã ghi file ra đĩa và tính sẵn SHA-256, khi đó content là None
+        self.spool = spool
+        if spool is not None:
+            self.document_hash = spool.document_hash
+
+    @classmethod
+    def from_spool(cls, spool, cache=None):
+        return cls(None, spool.filename, cache=cache, spool=spool)
+
+    def __len__(self):
+        return self.spool.size if self.spool is not None else len(self.content)
+
+    @property
+    def source(self):
+        return self.spool.path if self.spool is not None else self.content
+
+    @cached_property
+    def document_hash(self):
+        return hashlib.sha256(self.content).hexdigest()
+
+    @property
+    def cache_key(self):
+        # Cùng nội dung nhưng khác định dạng có thể cho văn bản khác nhau
+        return f"{self.document_hash}:{os.path.splitext(self.filename.lower())[1].lstrip('.')}"
+
+    @cached_property
+    def _analysis(self):
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key)
+            if cached is not None:
+                print(f"Dùng kết quả trích xuất đã cache cho {self.filename}")
+                return cached
+        text = extract_text(self.source, self.filename)
+        hashvalues = None
+        if text:
+            hashvalues = [int(v) for v in compute_minhash(get_shingles(text)).hashvalues]
+        analysis = {'text': text, 'hashvalues': hashvalues}
+        if self.cache is not None:
+            self.cache.put(self.cache_key, analysis)
+        return analysis
+
+    @property
+    def text(self):
+        return self._analysis['text']
+
+    @cached_property
+    def minhash(self):
+        hashvalues = self._analysis['hashvalues']
+        if hashvalues is None:
+            return None
+        m = MinHash(num_perm=NUM_PERM)
+        m.hashvalues = np.array(hashvalues, dtype=np.uint64)
+        return m
+
+    @cached_property
+    def content_hash(self):
+        if self.minhash is None:
+            print(f"Không tạo được content_hash cho {self.filename}")
+            return None
+        hash_value = encode_content_hash(self.minhash.hashvalues)
+        print(f"Tạo content_hash cho {self.filename}: {hash_value[:50]}...")
+        return hash_value
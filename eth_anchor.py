@@ -0,0 +1,278 @@
+# eth_anchor.py
+import queue
+import threading
+import time
+import uuid
+from eth_account import Account
+
+class NonceManager:
+    """Cấp nonce tăng dần cho một tài khoản mà không hỏi lại node Ethereum ở mỗi giao dịch."""
+
+    def __init__(self, web3, address):
+        self.web3 = web3
+        self.address = address
+        self.lock = threading.Lock()
+        self.next_nonce = None
+
+    def next(self):
+        with self.lock:
+            if self.next_nonce is None:
+                self.next_nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def resync(self):
+        """Gọi khi gửi giao dịch lỗi: lần sau sẽ lấy lại nonce từ node."""
+        with self.lock:
+            self.next_nonce = None
+
+class EthereumAnchorService:
+    """Hàng đợi gửi document_hash lên contract ở luồng nền, gom nhiều hash vào một giao dịch và theo dõi receipt."""
+
+    def __init__(self, web3, contract, chain_id=31337, gas_price_gwei='10', single_gas=100000,
+                 batch_base_gas=50000, batch_gas_per_document=60000, merkle_root_gas=100000,
+                 max_batch=1, max_wait=2, receipt_poll_interval=1, encode_hash=None, job_retention=3600):
+        self.web3 = web3
+        self.contract = contract
+        # Chuyển document_hash hex sang kiểu tham số của contract (string hoặc bytes32)
+        self.encode_hash = encode_hash or (lambda document_hash: document_hash)
+        self.chain_id = chain_id
+        self.gas_price_gwei = gas_price_gwei
+        self.single_gas = single_gas
+        self.batch_base_gas = batch_base_gas
+        self.batch_gas_per_document = batch_gas_per_document
+        self.merkle_root_gas = merkle_root_gas
+        # max_batch > 1: gom các hash cùng tài khoản vào một lần gọi storeDocuments
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.receipt_poll_interval = receipt_poll_interval
+        # Job đã xong (confirmed/failed) được giữ job_retention giây để client tra trạng thái rồi bị xóa
+        self.job_retention = job_retention
+        self.queue = queue.Queue()
+        # job_id -> thông tin job; tx_hash -> danh sách job_id chờ receipt
+        self.jobs = {}
+        self.pending_receipts = {}
+        # job_id -> hàm gọi lại khi job có kết quả cuối (confirmed/failed)
+        self.callbacks = {}
+        # job_id -> thời điểm xong, theo thứ tự xong
+        self.finished = {}
+        self.nonce_managers = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        if self.threads and all(thread.is_alive() for thread in self.threads):
+            return
+        self.threads = [
+            threading.Thread(target=self._submit_loop, name='eth-anchor-submit', daemon=True),
+            threading.Thread(target=self._receipt_loop, name='eth-anchor-receipts', daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+        print(f"Đã khởi động hàng đợi Ethereum: tối đa {self.max_batch} hash mỗi giao dịch")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _nonce_manager(self, address):
+        with self.lock:
+            if address not in self.nonce_managers:
+                self.nonce_managers[address] = NonceManager(self.web3, address)
+            return self.nonce_managers[address]
+
+    def submit(self, document_hashes, private_key, on_complete=None):
+        """Đưa một hoặc nhiều hash vào hàng đợi, trả về job_id để tra trạng thái."""
+        if isinstance(document_hashes, str):
+            document_hashes = [document_hashes]
+        return self._enqueue({'document_hashes': list(document_hashes)}, private_key, on_complete)
+
+    def submit_merkle_root(self, merkle_root, document_count, private_key, on_complete=None):
+        """Lưu gốc Merkle của một lô tài liệu bằng storeMerkleRoot (luôn gửi riêng một giao dịch)."""
+        return self._enqueue(
+            {'document_hashes': [], 'merkle_root': merkle_root, 'document_count': document_count},
+            private_key, on_complete
+        )
+
+    def _enqueue(self, fields, private_key, on_complete):
+        account = Account.from_key(private_key)
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'account': account.address,
+            'status': 'queued',
+            'tx_hash': None,
+            'block_number': None,
+            'error': None,
+            'submitted_at': None,
+            'confirmed_at': None
+        }
+        job.update(fields)
+        with self.lock:
+            self.jobs[job_id] = job
+            if on_complete:
+                self.callbacks[job_id] = on_complete
+        self.queue.put((job_id, private_key))
+        return job_id
+
+    def _finish(self, job_ids):
+        for job_id in job_ids:
+            with self.lock:
+                callback = self.callbacks.pop(job_id, None)
+                job = dict(self.jobs[job_id])
+                self.finished[job_id] = time.time()
+                self._evict_finished()
+            if callback:
+                try:
+                    callback(job)
+                except Exception as e:
+                    print(f"Lỗi trong callback của job Ethereum {job_id}: {str(e)}")
+
+    def _evict_finished(self):
+        now = time.time()
+        for job_id, finished_at in list(self.finished.items()):
+            if now - finished_at < self.job_retention:
+                break
+            del self.finished[job_id]
+            self.jobs.pop(job_id, None)
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout=120):
+        """Chờ job có receipt (dùng khi client muốn phản hồi đồng bộ như trước)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.status(job_id)
+            if job is None or job['status'] in ('confirmed', 'failed'):
+                return job
+            time.sleep(0.2)
+        return self.status(job_id)
+
+    def stats(self):
+        with self.lock:
+            self._evict_finished()
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {
+                'jobs': counts,
+                'queued': self.queue.qsize(),
+                'awaiting_receipt': len(self.pending_receipts),
+                'max_batch': self.max_batch,
+                'job_retention': self.job_retention,
+                'running': bool(self.threads and all(thread.is_alive() for thread in self.threads))
+            }
+
+    def _next_batch(self):
+        """Lấy các job trong hàng đợi cho tới khi đủ max_batch hash hoặc hết max_wait giây."""
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        count = max(1, len(self.jobs[batch[0][0]]['document_hashes']))
+        deadline = time.time() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += max(1, len(self.jobs[item[0]]['document_hashes']))
+        return batch
+
+    def _submit_loop(self):
+        while not self.stop_event.is_set():
+            batch = self._next_batch()
+            # Chỉ gom các job ký bằng cùng một tài khoản; job gốc Merkle luôn gửi riêng
+            groups = {}
+            for job_id, private_key in batch:
+                key = (private_key, job_id if 'merkle_root' in self.jobs[job_id] else None)
+                groups.setdefault(key, []).append(job_id)
+            for (private_key, _), job_ids in groups.items():
+                try:
+                    self._send(job_ids, private_key)
+                except Exception as e:
+                    # Lỗi ở bất kỳ bước nào trước khi gửi được (tạo lời gọi contract, mã hóa hash, ký...)
+                    # đều kết thúc job là failed, để callback và wait() không thấy trạng thái queued
+                    print(f"Lỗi khi gửi giao dịch Ethereum: {str(e)}")
+                    with self.lock:
+                        for job_id in job_ids:
+                            self.jobs[job_id]['status'] = 'failed'
+                            self.jobs[job_id]['error'] = str(e)
+                    self._finish(job_ids)
+
+    def _send(self, job_ids, private_key):
+        with self.lock:
+            jobs = [self.jobs[job_id] for job_id in job_ids]
+        account = Account.from_key(private_key)
+        document_hashes = [h for job in jobs for h in job['document_hashes']]
+        if 'merkle_root' in jobs[0]:
+            function = self.contract.functions.storeMerkleRoot(
+                bytes.fromhex(jobs[0]['merkle_root']), jobs[0]['document_count']
+            )
+            gas = self.merkle_root_gas
+        elif len(document_hashes) == 1:
+            function = self.contract.functions.storeDocument(self.encode_hash(document_hashes[0]))
+            gas = self.single_gas
+        else:
+            function = self.contract.functions.storeDocuments([self.encode_hash(h) for h in document_hashes])
+            gas = self.batch_base_gas + self.batch_gas_per_document * len(document_hashes)
+
+        nonce_manager = self._nonce_manager(account.address)
+        try:
+            transaction = function.build_transaction({
+                'chainId': self.chain_id,
+                'gas': gas,
+                'gasPrice': self.web3.to_wei(self.gas_price_gwei, 'gwei'),
+                'nonce': nonce_manager.next(),
+            })
+            signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key)
+            tx_hash = self.web3.to_hex(self.web3.eth.send_raw_transaction(signed_txn.raw_transaction))
+        except Exception:
+            # Nonce cục bộ có thể đã lệch (vd. tài khoản được dùng ở nơi khác), lấy lại từ node
+            nonce_manager.resync()
+            raise
+
+        with self.lock:
+            for job in jobs:
+                job['status'] = 'submitted'
+                job['tx_hash'] = tx_hash
+                job['submitted_at'] = time.time()
+            self.pending_receipts[tx_hash] = job_ids
+        if 'merkle_root' in jobs[0]:
+            print(f"Đã gửi giao dịch Ethereum {tx_hash} với gốc Merkle của {jobs[0]['document_count']} tài liệu")
+        else:
+            print(f"Đã gửi giao dịch Ethereum {tx_hash} với {len(document_hashes)} hash")
+
+    def _receipt_loop(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                tx_hashes = list(self.pending_receipts)
+            for tx_hash in tx_hashes:
+                try:
+                    receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+                except Exception:
+                    # Chưa được đào (TransactionNotFound) hoặc node tạm thời lỗi, thử lại ở vòng sau
+                    continue
+                if receipt is None:
+                    continue
+                succeeded = receipt.get('status', 1) == 1
+                with self.lock:
+                    job_ids = self.pending_receipts.pop(tx_hash, [])
+                    for job_id in job_ids:
+                        job = self.jobs[job_id]
+                        job['status'] = 'confirmed' if succeeded else 'failed'
+                        job['block_number'] = receipt['blockNumber']
+                        job['confirmed_at'] = time.time()
+                        if not succeeded:
+                            job['error'] = 'Giao dịch bị revert'
+                print(f"Receipt {tx_hash}: block {receipt['blockNumber']}, status={'ok' if succeeded else 'revert'}")
+                self._finish(job_ids)
+            self.stop_event.wait(self.receipt_poll_interval)
@@ -0,0 +1,176 @@
+# eth_log_indexer.py
+import sqlite3
+import threading
+import time
+from eth_abi import decode
+
+class EthereumLogIndexer:
+    """Luồng nền đọc sự kiện DocumentStored theo từng khoảng block và lưu vào SQLite.
+
+    Chỉ đọc các block mới sau block cuối đã xử lý; timestamp và người gửi được lấy một lần cho mỗi
+    block/giao dịch rồi lưu lại, nên /get_chain_ethereum không phải gọi RPC cho từng log.
+    """
+
+    def __init__(self, web3, contract_address, document_hash_type, path, start_block=0,
+                 range_size=2000, interval=5):
+        self.web3 = web3
+        self.contract_address = contract_address
+        self.document_hash_type = document_hash_type
+        self.path = path
+        self.start_block = start_block
+        self.range_size = range_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        # Chỉ một lượt đồng bộ chạy tại một thời điểm (luồng nền hoặc request gọi trực tiếp)
+        self.sync_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_sync = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS eth_documents (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_hash TEXT NOT NULL,
+            block_number INTEGER NOT NULL,
+            tx_hash TEXT NOT NULL,
+            log_index INTEGER NOT NULL,
+            sender TEXT,
+            timestamp INTEGER,
+            UNIQUE (tx_hash, log_index))''')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS eth_indexer_state (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+        # Chỉ mục thuộc về một contract và một kiểu sự kiện; đổi contract thì đọc lại từ đầu
+        source = f'{contract_address}:{document_hash_type}'
+        if self._get_state('source') != source:
+            self._reset(source)
+
+    @property
+    def event_topic(self):
+        return self.web3.to_hex(self.web3.keccak(text=f"DocumentStored({self.document_hash_type})"))
+
+    def _get_state(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM eth_indexer_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _reset(self, source):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM eth_documents')
+                self.conn.execute("DELETE FROM sqlite_sequence WHERE name = 'eth_documents'")
+                self.conn.execute('DELETE FROM eth_indexer_state')
+                self.conn.execute("INSERT INTO eth_indexer_state (key, value) VALUES ('source', ?)", (source,))
+        print(f"Đã xóa chỉ mục sự kiện Ethereum, sẽ đọc lại từ block {self.start_block}")
+
+    @property
+    def last_block(self):
+        value = self._get_state('last_block')
+        return int(value) if value is not None else self.start_block - 1
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='eth-log-indexer', daemon=True)
+        self.thread.start()
+        print(f"Đã khởi động bộ đọc sự kiện Ethereum, chu kỳ {self.interval}s")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_running(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"Lỗi khi đọc sự kiện Ethereum: {str(e)}")
+            self.stop_event.wait(self.interval)
+
+    def sync_once(self):
+        """Đọc các log mới tới block hiện tại; trả về số tài liệu mới được thêm."""
+        with self.sync_lock:
+            latest = self.web3.eth.block_number
+            if latest < self.last_block:
+                # Chuỗi phát triển cục bộ (Ganache/Hardhat) đã bị khởi động lại
+                print(f"Block hiện tại {latest} nhỏ hơn block đã đọc {self.last_block}, đọc lại từ đầu")
+                self._reset(self._get_state('source'))
+            added = 0
+            from_block = self.last_block + 1
+            while from_block <= latest:
+                to_block = min(from_block + self.range_size - 1, latest)
+                added += self._index_range(from_block, to_block)
+                from_block = to_block + 1
+            self.last_sync = time.time()
+            if added:
+                print(f"Đã đọc thêm {added} tài liệu từ Ethereum, tới block {latest}")
+            return added
+
+    def _index_range(self, from_block, to_block):
+        logs = self.web3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': self.contract_address,
+            'topics': [self.event_topic]
+        })
+        # Mỗi block/giao dịch chỉ gọi RPC một lần dù có nhiều log
+        timestamps = {}
+        senders = {}
+        rows = []
+        for log in logs:
+            document_hash = decode([self.document_hash_type], log['data'])[0]
+            if isinstance(document_hash, bytes):
+                document_hash = document_hash.hex()
+            block_number = log['blockNumber']
+            tx_hash = log['transactionHash'].hex()
+            if block_number not in timestamps:
+                timestamps[block_number] = self.web3.eth.get_block(block_number)['timestamp']
+            if tx_hash not in senders:
+                senders[tx_hash] = self.web3.eth.get_transaction(tx_hash)['from']
+            rows.append((document_hash, block_number, tx_hash, log['logIndex'],
+                         senders[tx_hash], timestamps[block_number]))
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    '''INSERT OR IGNORE INTO eth_documents
+                       (document_hash, block_number, tx_hash, log_index, sender, timestamp)
+                       VALUES (?, ?, ?, ?, ?, ?)''',
+                    rows
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO eth_indexer_state (key, value) VALUES ('last_block', ?)",
+                    (str(to_block),)
+                )
+        return len(rows)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM eth_documents').fetchone()[0]
+
+    def get_documents(self, start=0, limit=None):
+        """Các tài liệu đã đọc theo thứ tự trên chuỗi, bắt đầu từ vị trí start (tính từ 0)."""
+        with self.lock:
+            rows = self.conn.execute(
+                '''SELECT seq, document_hash, block_number, tx_hash, sender, timestamp
+                   FROM eth_documents ORDER BY seq LIMIT ? OFFSET ?''',
+                (-1 if limit is None else limit, start)
+            ).fetchall()
+        return [
+            {
+                'document_hash': document_hash,
+                'block_number': block_number,
+                'tx_hash': tx_hash,
+                'sender': sender,
+                'timestamp': timestamp
+            }
+            for _, document_hash, block_number, tx_hash, sender, timestamp in rows
+        ]
+
+    def status(self):
+        return {
+            'indexed_documents': len(self),
+            'last_block': self.last_block,
+            'last_sync': self.last_sync,
+            'running': self.is_running()
+        }
@@ -0,0 +1,94 @@
+# eth_verifier.py
+import threading
+import time
+
+class EthereumBatchVerifier:
+    """Xác minh nhiều document_hash trên contract trong ít round-trip nhất có thể.
+
+    Contract có verifyDocuments (v2) thì mỗi lô là một eth_call; nếu không thì gộp các verifyDocument
+    vào một JSON-RPC batch. Kết quả dương được cache vì tài liệu đã lưu không bao giờ bị xóa khỏi contract;
+    TTL ngắn chỉ để xử lý trường hợp chuỗi phát triển cục bộ bị khởi động lại.
+    """
+
+    def __init__(self, web3, contract, encode_hash=None, batch_view=False, chunk_size=500,
+                 positive_ttl=300, max_entries=100000):
+        self.web3 = web3
+        self.contract = contract
+        self.encode_hash = encode_hash or (lambda document_hash: document_hash)
+        self.batch_view = batch_view
+        self.chunk_size = chunk_size
+        self.positive_ttl = positive_ttl
+        self.max_entries = max_entries
+        # document_hash -> thời điểm hết hạn
+        self.positive_cache = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.round_trips = 0
+
+    def _cached(self, document_hash, now):
+        expires_at = self.positive_cache.get(document_hash)
+        if expires_at is None:
+            return False
+        if expires_at < now:
+            del self.positive_cache[document_hash]
+            return False
+        return True
+
+    def _remember(self, document_hashes, now):
+        if len(self.positive_cache) + len(document_hashes) > self.max_entries:
+            # Bỏ các mục hết hạn trước; nếu vẫn đầy thì xóa toàn bộ (cache chỉ để tăng tốc)
+            self.positive_cache = {h: t for h, t in self.positive_cache.items() if t >= now}
+            if len(self.positive_cache) + len(document_hashes) > self.max_entries:
+                self.positive_cache = {}
+        for document_hash in document_hashes:
+            self.positive_cache[document_hash] = now + self.positive_ttl
+
+    def verify(self, document_hash):
+        return self.verify_many([document_hash])[document_hash]
+
+    def verify_many(self, document_hashes):
+        """Trả về {document_hash: bool}; lỗi RPC được ném ra cho nơi gọi xử lý."""
+        now = time.time()
+        results = {}
+        missing = []
+        with self.lock:
+            for document_hash in dict.fromkeys(document_hashes):
+                if self._cached(document_hash, now):
+                    results[document_hash] = True
+                    self.hits += 1
+                else:
+                    missing.append(document_hash)
+                    self.misses += 1
+
+        for start in range(0, len(missing), self.chunk_size):
+            chunk = missing[start:start + self.chunk_size]
+            stored = self._call_chunk(chunk)
+            results.update(zip(chunk, stored))
+            with self.lock:
+                self._remember([h for h, is_stored in zip(chunk, stored) if is_stored], time.time())
+        return results
+
+    def _call_chunk(self, document_hashes):
+        keys = [self.encode_hash(h) for h in document_hashes]
+        with self.lock:
+            self.round_trips += 1
+        if len(keys) == 1:
+            return [self.contract.functions.verifyDocument(keys[0]).call()]
+        if self.batch_view:
+            return list(self.contract.functions.verifyDocuments(keys).call())
+        with self.web3.batch_requests() as batch:
+            for key in keys:
+                batch.add(self.contract.functions.verifyDocument(key))
+            return list(batch.execute())
+
+    def stats(self):
+        with self.lock:
+            return {
+                'cached_positive': len(self.positive_cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'round_trips': self.round_trips,
+                'positive_ttl': self.positive_ttl,
+                'batch_view': self.batch_view
+            }
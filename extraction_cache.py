@@ -0,0 +1,149 @@
+# extraction_cache.py
+import json
+import os
+import threading
+from collections import OrderedDict
+
+class ExtractionCache:
+    """Cache LRU (kèm tầng đĩa tùy chọn, giới hạn theo max_disk_bytes) ánh xạ SHA-256 của file -> văn bản chuẩn hóa và MinHash."""
+
+    def __init__(self, max_entries=256, disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Tầng đĩa: đường dẫn -> kích thước, file ít được dùng nhất đứng đầu.
+        # disk_lock giữ khi ghi/xóa file để không xóa nhầm file vừa được ghi lại
+        self.disk_entries = OrderedDict()
+        self.disk_bytes = 0
+        self.disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            if not os.path.exists(disk_dir):
+                os.makedirs(disk_dir)
+            self._scan_disk()
+
+    def _disk_path(self, key):
+        # key có dạng "<sha256>:<đuôi file>", chỉ gồm ký tự an toàn cho tên file sau khi thay ':'
+        return os.path.join(self.disk_dir, key.replace(':', '.') + '.json')
+
+    def _scan_disk(self):
+        # Thứ tự truy cập của lần chạy trước được giữ qua mtime (cập nhật mỗi lần đọc trúng)
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        with self.disk_lock:
+            for _, path, size in sorted(files):
+                self.disk_entries[path] = size
+                self.disk_bytes += size
+            self._evict_disk()
+        print(f"Cache trích xuất trên đĩa: {len(self.disk_entries)} file, {self.disk_bytes} byte")
+
+    def _evict_disk(self):
+        # Gọi khi đang giữ disk_lock: xóa file ít được dùng nhất cho tới khi tổng dung lượng <= max_disk_bytes
+        evicted = 0
+        while self.disk_bytes > self.max_disk_bytes and self.disk_entries:
+            path, size = self.disk_entries.popitem(last=False)
+            self.disk_bytes -= size
+            evicted += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Lỗi khi xóa cache trích xuất {path}: {str(e)}")
+        if evicted:
+            with self.lock:
+                self.evictions += evicted
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Lỗi khi đọc cache trích xuất {path}: {str(e)}")
+            return None
+        with self.disk_lock:
+            if path in self.disk_entries:
+                self.disk_entries.move_to_end(path)
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+        return value
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = path + '.tmp'
+        with self.disk_lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, path)
+                size = os.path.getsize(path)
+            except Exception as e:
+                print(f"Lỗi khi ghi cache trích xuất {path}: {str(e)}")
+                return
+            self.disk_bytes += size - self.disk_entries.pop(path, 0)
+            self.disk_entries[path] = size
+            self._evict_disk()
+
+    def _put_memory(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        value = self._read_disk(key)
+        with self.lock:
+            if value is not None:
+                self.disk_hits += 1
+                self._put_memory(key, value)
+            else:
+                self.misses += 1
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_enabled': bool(self.disk_dir),
+                'disk_entries': len(self.disk_entries),
+                'disk_bytes': self.disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes
+            }
@@ -0,0 +1,34 @@
+# hash_client.py
+# Tính SHA-256 của file ở phía client rồi chỉ gửi hash lên node để xác minh, không tải file lên.
+# Cách dùng: python hash_client.py http://192.168.1.8:5000 file1.pdf file2.docx [--no-ethereum]
+import hashlib
+import sys
+import requests
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def verify_files(node_url, paths, check_ethereum=True):
+    node_url = node_url.rstrip('/')
+    with requests.Session() as session:
+        for path in paths:
+            document_hash = sha256_file(path)
+            response = session.get(
+                f'{node_url}/verify_hash/{document_hash}',
+                params={'check_ethereum': 'true' if check_ethereum else 'false'},
+                timeout=30
+            )
+            result = response.json()
+            print(f"{path}: {document_hash} -> {result.get('message')} "
+                  f"(chuỗi: {result.get('on_chain')}, ethereum: {result.get('on_ethereum')})")
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 2:
+        print("Cách dùng: python hash_client.py <node_url> <file> [<file> ...] [--no-ethereum]")
+        sys.exit(1)
+    verify_files(args[0], args[1:], check_ethereum='--no-ethereum' not in sys.argv)
@@ -0,0 +1,54 @@
+# merkle.py
+import hashlib
+
+# Cây Merkle dùng SHA-256 với cặp node được sắp xếp trước khi băm (giống hàm verifyDocumentProof
+# trong DocumentStorage.sol), nên proof không cần kèm vị trí trái/phải. Node lẻ được đưa thẳng lên tầng trên.
+# Lá và node trong được băm với tiền tố khác nhau, nếu không một "tài liệu" 64 byte ghép từ hai hash con
+# sẽ băm ra đúng node trong và được coi là hợp lệ.
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+# Tăng khi đổi cách băm: các lô đã đóng theo cách cũ phải được đóng lại
+TREE_VERSION = 2
+
+def leaf_from_hex(document_hash):
+    """Lá của cây: SHA-256(0x00 || SHA-256 của tài liệu)."""
+    return hashlib.sha256(LEAF_PREFIX + bytes.fromhex(document_hash)).digest()
+
+def hash_pair(a, b):
+    return hashlib.sha256(NODE_PREFIX + (a + b if a <= b else b + a)).digest()
+
+class MerkleTree:
+    def __init__(self, leaves):
+        if not leaves:
+            raise ValueError("Cây Merkle cần ít nhất một lá")
+        self.levels = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2 == 1:
+                parents.append(level[-1])
+            self.levels.append(parents)
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    def proof(self, position):
+        """Danh sách hash anh em từ lá lên gốc cho lá ở vị trí position."""
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = position ^ 1
+            if sibling < len(level):
+                proof.append(level[sibling])
+            position //= 2
+        return proof
+
+def verify_proof(leaf, proof, root):
+    computed = leaf
+    for sibling in proof:
+        computed = hash_pair(computed, sibling)
+    return computed == root
+
+def verify_document_proof(document_hash, proof, root):
+    """Kiểm tra như verifyDocumentProof của contract: nhận SHA-256 của tài liệu, không nhận lá."""
+    return verify_proof(leaf_from_hex(document_hash), proof, root)
@@ -0,0 +1,229 @@
+# merkle_anchor.py
+import sqlite3
+import threading
+import time
+from merkle import MerkleTree, TREE_VERSION, leaf_from_hex
+
+class MerkleBatchAnchor:
+    """Gom document_hash thành lô, lưu gốc Merkle của mỗi lô lên Ethereum bằng một giao dịch.
+
+    Lá và lô được lưu trong SQLite để sau khi khởi động lại vẫn cấp được inclusion proof.
+    """
+
+    def __init__(self, path, anchor_service, private_key, contract=None, batch_size=1000, max_wait=60):
+        self.path = path
+        self.anchor_service = anchor_service
+        self.private_key = private_key
+        self.contract = contract
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Cây của lô được truy vấn gần nhất, tránh dựng lại khi nhiều client lấy proof cùng lô
+        self.cached_tree = (None, None)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS merkle_batches (
+            batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            root TEXT NOT NULL,
+            document_count INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            job_id TEXT,
+            tx_hash TEXT,
+            block_number INTEGER,
+            created_at REAL NOT NULL)''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS merkle_leaves (
+            document_hash TEXT PRIMARY KEY,
+            batch_id INTEGER,
+            position INTEGER,
+            added_at REAL NOT NULL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS merkle_leaves_batch ON merkle_leaves (batch_id, position)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS merkle_state (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+        self._check_tree_version()
+
+    def _check_tree_version(self):
+        # Gốc của các lô đóng theo cách băm cũ không khớp với proof mới: đưa lá về hàng chờ để đóng lô lại
+        row = self.conn.execute("SELECT value FROM merkle_state WHERE key = 'tree_version'").fetchone()
+        if row is not None and int(row[0]) == TREE_VERSION:
+            return
+        with self.conn:
+            batches = self.conn.execute('SELECT COUNT(*) FROM merkle_batches').fetchone()[0]
+            if batches:
+                self.conn.execute('DELETE FROM merkle_batches')
+                self.conn.execute('UPDATE merkle_leaves SET batch_id = NULL, position = NULL')
+                print(f"Cách băm cây Merkle đã đổi, bỏ {batches} lô cũ và đóng lô lại cho các tài liệu")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO merkle_state (key, value) VALUES ('tree_version', ?)", (str(TREE_VERSION),)
+            )
+
+    @property
+    def enabled(self):
+        return bool(self.private_key)
+
+    def start(self):
+        if not self.enabled:
+            print("Chưa cấu hình private key cho lô Merkle, bỏ qua")
+            return
+        if self.thread and self.thread.is_alive():
+            return
+        self.anchor_service.start()
+        self._resume()
+        self.thread = threading.Thread(target=self._run, name='merkle-anchor', daemon=True)
+        self.thread.start()
+        print(f"Đã khởi động lô Merkle: tối đa {self.batch_size} tài liệu hoặc {self.max_wait}s mỗi lô")
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+
+    def add(self, document_hash):
+        """Thêm hash vào lô đang chờ; hash đã có thì giữ nguyên. Trả về True nếu là hash mới."""
+        with self.lock:
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO merkle_leaves (document_hash, added_at) VALUES (?, ?)',
+                (document_hash, time.time())
+            )
+            self.conn.commit()
+        with self.condition:
+            self.condition.notify()
+        return cursor.rowcount == 1
+
+    def _pending(self):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT COUNT(*), MIN(added_at) FROM merkle_leaves WHERE batch_id IS NULL'
+            ).fetchone()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            count, oldest = self._pending()
+            if count and (count >= self.batch_size or time.time() - oldest >= self.max_wait):
+                try:
+                    self.seal_batch()
+                except Exception as e:
+                    print(f"Lỗi khi đóng lô Merkle: {str(e)}")
+                    self.stop_event.wait(1)
+                continue
+            timeout = self.max_wait - (time.time() - oldest) if count else self.max_wait
+            with self.condition:
+                self.condition.wait(timeout=max(0.1, min(timeout, self.max_wait)))
+
+    def seal_batch(self):
+        """Dựng cây cho các hash đang chờ (tối đa batch_size), lưu lô và gửi gốc lên Ethereum."""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT document_hash FROM merkle_leaves WHERE batch_id IS NULL ORDER BY added_at, rowid LIMIT ?',
+                (self.batch_size,)
+            ).fetchall()
+            if not rows:
+                return None
+            document_hashes = [row[0] for row in rows]
+            root = MerkleTree([leaf_from_hex(h) for h in document_hashes]).root.hex()
+            with self.conn:
+                batch_id = self.conn.execute(
+                    'INSERT INTO merkle_batches (root, document_count, status, created_at) VALUES (?, ?, ?, ?)',
+                    (root, len(document_hashes), 'queued', time.time())
+                ).lastrowid
+                self.conn.executemany(
+                    'UPDATE merkle_leaves SET batch_id = ?, position = ? WHERE document_hash = ?',
+                    [(batch_id, position, h) for position, h in enumerate(document_hashes)]
+                )
+        print(f"Đã đóng lô Merkle {batch_id}: {len(document_hashes)} tài liệu, root={root}")
+        self._submit(batch_id, root, len(document_hashes))
+        return batch_id
+
+    def _submit(self, batch_id, root, document_count):
+        job_id = self.anchor_service.submit_merkle_root(
+            root, document_count, self.private_key,
+            on_complete=lambda job: self._on_anchored(batch_id, job)
+        )
+        self._update_batch(batch_id, status='queued', job_id=job_id)
+
+    def _on_anchored(self, batch_id, job):
+        self._update_batch(batch_id, status=job['status'], tx_hash=job['tx_hash'], block_number=job['block_number'])
+        print(f"Lô Merkle {batch_id}: {job['status']}, tx={job['tx_hash']}")
+
+    def _update_batch(self, batch_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self.lock:
+            self.conn.execute(
+                f'UPDATE merkle_batches SET {assignments} WHERE batch_id = ?',
+                list(fields.values()) + [batch_id]
+            )
+            self.conn.commit()
+
+    def _resume(self):
+        """Gửi lại các lô chưa được xác nhận trước lần dừng node trước."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT batch_id, root, document_count FROM merkle_batches WHERE status != 'confirmed'"
+            ).fetchall()
+        for batch_id, root, document_count in rows:
+            if self.contract is not None:
+                try:
+                    if self.contract.functions.verifyMerkleRoot(bytes.fromhex(root)).call():
+                        self._update_batch(batch_id, status='confirmed')
+                        continue
+                except Exception as e:
+                    print(f"Không kiểm tra được gốc Merkle {root}: {str(e)}")
+            print(f"Gửi lại lô Merkle {batch_id}")
+            self._submit(batch_id, root, document_count)
+
+    def _tree_for(self, batch_id):
+        cached_batch_id, tree = self.cached_tree
+        if cached_batch_id == batch_id:
+            return tree
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT document_hash FROM merkle_leaves WHERE batch_id = ? ORDER BY position', (batch_id,)
+            ).fetchall()
+        tree = MerkleTree([leaf_from_hex(row[0]) for row in rows])
+        self.cached_tree = (batch_id, tree)
+        return tree
+
+    def proof(self, document_hash):
+        """Inclusion proof của document_hash, hoặc None nếu hash chưa từng được thêm."""
+        with self.lock:
+            leaf = self.conn.execute(
+                'SELECT batch_id, position FROM merkle_leaves WHERE document_hash = ?', (document_hash,)
+            ).fetchone()
+            if leaf is None:
+                return None
+            batch_id, position = leaf
+            if batch_id is None:
+                return {'document_hash': document_hash, 'status': 'pending'}
+            batch = self.conn.execute(
+                'SELECT root, document_count, status, tx_hash, block_number FROM merkle_batches WHERE batch_id = ?',
+                (batch_id,)
+            ).fetchone()
+        tree = self._tree_for(batch_id)
+        root, document_count, status, tx_hash, block_number = batch
+        return {
+            'document_hash': document_hash,
+            'batch_id': batch_id,
+            'position': position,
+            'merkle_root': root,
+            'proof': [sibling.hex() for sibling in tree.proof(position)],
+            'document_count': document_count,
+            'status': status,
+            'tx_hash': tx_hash,
+            'block_number': block_number
+        }
+
+    def stats(self):
+        count, _ = self._pending()
+        with self.lock:
+            batches = dict(self.conn.execute(
+                'SELECT status, COUNT(*) FROM merkle_batches GROUP BY status'
+            ).fetchall())
+        return {
+            'pending_documents': count,
+            'batches': batches,
+            'batch_size': self.batch_size,
+            'max_wait': self.max_wait,
+            'running': bool(self.thread and self.thread.is_alive())
+        }
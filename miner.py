@@ -0,0 +1,95 @@
+# miner.py
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+
+def is_proof_valid(proof, previous_proof, difficulty):
+    hash_operation = hashlib.sha256(str(proof**2 - previous_proof**2).encode()).hexdigest()
+    return hash_operation[:difficulty] == '0' * difficulty
+
+def _search(previous_proof, difficulty, start, step, stop_event, result_queue, batch=5000):
+    """Duyệt các nonce start, start+step, ... cho tới khi tìm thấy proof hoặc bị dừng."""
+    target = '0' * difficulty
+    previous_square = previous_proof**2
+    proof = start
+    while not stop_event.is_set():
+        for _ in range(batch):
+            if hashlib.sha256(str(proof**2 - previous_square).encode()).hexdigest()[:difficulty] == target:
+                result_queue.put(proof)
+                stop_event.set()
+                return
+            proof += step
+
+class ProofOfWorkMiner:
+    """Tìm proof-of-work, chia không gian nonce cho nhiều tiến trình và có thể hủy giữa chừng."""
+
+    def __init__(self, workers=None, parallel_min_difficulty=5):
+        self.workers = workers or os.cpu_count() or 1
+        # Với độ khó thấp, chi phí tạo tiến trình lớn hơn thời gian đào nên đào ngay trong tiến trình hiện tại
+        self.parallel_min_difficulty = parallel_min_difficulty
+        self.context = multiprocessing.get_context()
+        self.active_events = set()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """Hủy mọi lượt đào đang chạy (vd. khi nhận block cạnh tranh qua /add_block)."""
+        with self.lock:
+            for event in self.active_events:
+                event.set()
+            cancelled = len(self.active_events)
+        if cancelled:
+            print(f"Đã hủy {cancelled} lượt đào đang chạy")
+
+    def mine(self, previous_proof, difficulty):
+        """Trả về proof hợp lệ, hoặc None nếu lượt đào bị hủy."""
+        if self.workers <= 1 or difficulty < self.parallel_min_difficulty:
+            return self._mine_local(previous_proof, difficulty)
+        return self._mine_parallel(previous_proof, difficulty)
+
+    def _mine_local(self, previous_proof, difficulty):
+        stop_event = threading.Event()
+        result_queue = queue.Queue()
+        with self.lock:
+            self.active_events.add(stop_event)
+        try:
+            _search(previous_proof, difficulty, 1, 1, stop_event, result_queue)
+        finally:
+            with self.lock:
+                self.active_events.discard(stop_event)
+        return result_queue.get_nowait() if not result_queue.empty() else None
+
+    def _mine_parallel(self, previous_proof, difficulty):
+        cancel_event = threading.Event()
+        stop_event = self.context.Event()
+        result_queue = self.context.Queue()
+        processes = [
+            self.context.Process(
+                target=_search,
+                args=(previous_proof, difficulty, worker + 1, self.workers, stop_event, result_queue),
+                daemon=True
+            )
+            for worker in range(self.workers)
+        ]
+        with self.lock:
+            self.active_events.add(cancel_event)
+        try:
+            for process in processes:
+                process.start()
+            while not cancel_event.is_set():
+                try:
+                    return result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        try:
+                            return result_queue.get(timeout=1)
+                        except queue.Empty:
+                            return None
+            return None
+        finally:
+            stop_event.set()
+            for process in processes:
+                process.join(timeout=5)
+            with self.lock:
+                self.active_events.discard(cancel_event)
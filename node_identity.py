@@ -0,0 +1,61 @@
+# node_identity.py
+import hashlib
+import os
+import time
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+def attestation_message(document_hash, content_hash, origin, timestamp):
+    # content_hash có thể dài vài KB nên chỉ ký SHA-256 của nó
+    content_digest = hashlib.sha256((content_hash or '').encode()).hexdigest()
+    return encode_defunct(text=f'{document_hash}:{content_digest}:{origin}:{timestamp}')
+
+class NodeIdentity:
+    """Khóa ký của node (lưu trong file cục bộ) dùng để ký xác nhận giao dịch gửi cho các peer."""
+
+    def __init__(self, key_path):
+        self.key_path = key_path
+        if os.path.exists(key_path):
+            with open(key_path, 'r') as f:
+                self.account = Account.from_key(f.read().strip())
+        else:
+            folder = os.path.dirname(key_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            self.account = Account.create()
+            with open(key_path, 'w') as f:
+                f.write(self.account.key.hex())
+            print(f"Đã tạo khóa ký mới cho node: {self.account.address}")
+
+    @property
+    def address(self):
+        return self.account.address
+
+    def attest(self, document_hash, content_hash, origin):
+        """Ký (document_hash, content_hash, origin) sau khi node đã tự kiểm tra tài liệu."""
+        timestamp = int(time.time())
+        signed = Account.sign_message(
+            attestation_message(document_hash, content_hash, origin, timestamp),
+            self.account.key
+        )
+        return {
+            'signer': self.address,
+            'signature': signed.signature.hex(),
+            'timestamp': timestamp
+        }
+
+def verify_attestation(attestation, document_hash, content_hash, origin, max_age=300):
+    """Trả về (hợp lệ, lý do)."""
+    try:
+        timestamp = int(attestation['timestamp'])
+        if abs(time.time() - timestamp) > max_age:
+            return False, 'Chữ ký xác nhận đã hết hạn'
+        signer = Account.recover_message(
+            attestation_message(document_hash, content_hash, origin, timestamp),
+            signature=attestation['signature']
+        )
+    except Exception as e:
+        return False, f'Chữ ký xác nhận không hợp lệ: {str(e)}'
+    if signer != attestation.get('signer'):
+        return False, 'Chữ ký không khớp với node gửi'
+    return True, None
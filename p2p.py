@@ -1,10 +1,60 @@
 # p2p.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
+
+class PeerSessionPool:
+    """Mỗi peer dùng một requests.Session riêng với pool kết nối keep-alive."""
+
+    def __init__(self, pool_size=10, timeout=10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _peer_key(self, url):
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'
+
+    def session_for(self, url):
+        key = self._peer_key(url)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[key] = session
+            return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session_for(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+# Pool dùng chung cho mọi kết nối giữa các node
+peer_sessions = PeerSessionPool()
 
 class NodeRegistry:
-    def __init__(self, bootstrap_url=None):
+    def __init__(self, bootstrap_url=None, sessions=None):
         self.peers = set()
         self.bootstrap_url = bootstrap_url
+        self.sessions = sessions or peer_sessions
         if bootstrap_url:
             self.peers.add(bootstrap_url)  # Thêm bootstrap vào peers
             self.discover_peers()
@@ -20,7 +70,7 @@ class NodeRegistry:
         if not self.bootstrap_url:
             return
         try:
-            response = requests.get(f'{self.bootstrap_url}/get_nodes', timeout=10)
+            response = self.sessions.get(f'{self.bootstrap_url}/get_nodes', timeout=10)
             if response.status_code == 200:
                 peers = response.json()['nodes']
                 for peer in peers:
@@ -31,4 +81,96 @@ class NodeRegistry:
     def get_peers(self):
         return list(self.peers)
 
+class PeerBroadcaster:
+    """Gửi request tới nhiều peer song song, thử lại với backoff tăng dần."""
+
+    def __init__(self, max_workers=16, retries=3, backoff=0.5, max_backoff=8, sessions=None):
+        self.sessions = sessions or peer_sessions
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def post(self, url, data=None, files=None, timeout=60, retries=None):
+        """Gửi một request tới url, thử lại với backoff tăng dần; trả về response hoặc None."""
+        retries = retries or self.retries
+        for attempt in range(retries):
+            try:
+                if files:
+                    response = self.sessions.post(url, data=data, files=files, timeout=timeout)
+                else:
+                    response = self.sessions.post(url, json=data, timeout=timeout)
+                print(f"Broadcast tới {url}: {response.status_code}, response={response.text}")
+                return response
+            except Exception as e:
+                print(f"Lỗi khi broadcast tới {url}, lần thử {attempt + 1}/{retries}: {str(e)}")
+                if attempt < retries - 1:
+                    time.sleep(min(self.backoff * (2 ** attempt), self.max_backoff))
+        print(f"Broadcast tới {url} thất bại sau {retries} lần thử")
+        return None
+
+    def broadcast(self, peers, path, data=None, files=None, timeout=60):
+        """Gửi tới tất cả peer cùng lúc, trả về {peer: future} mà không chờ kết quả."""
+        return {
+            peer: self.executor.submit(self.post, f'{peer}{path}', data, files, timeout)
+            for peer in peers
+        }
+
+    def collect_majority(self, peers, path, data=None, files=None, total_nodes=None,
+                         local_votes=1, timeout=60, is_valid=None, on_complete=None):
+        """Gửi song song và dừng ngay khi đã đủ (hoặc không thể đạt) đa số phiếu hợp lệ.
+
+        Trả về (valid_count, responded) với responded là số peer đã trả lời trước khi quyết định.
+        on_complete (nếu có) được gọi một lần khi mọi request đã xong, kể cả các request còn chạy sau khi đã quyết định.
+        """
+        peers = list(peers)
+        if total_nodes is None:
+            total_nodes = len(peers) + local_votes
+        if is_valid is None:
+            is_valid = lambda response: response is not None and response.status_code == 200 and response.json().get('is_valid')
+
+        valid_count = local_votes
+        remaining = len(peers)
+        responded = 0
+        if valid_count > total_nodes / 2 or valid_count + remaining <= total_nodes / 2:
+            if on_complete:
+                on_complete()
+            return valid_count, responded
+
+        futures = self.broadcast(peers, path, data, files, timeout)
+        if on_complete:
+            self._when_all_done(list(futures.values()), on_complete)
+        for future in as_completed(futures.values()):
+            remaining -= 1
+            responded += 1
+            try:
+                if is_valid(future.result()):
+                    valid_count += 1
+            except Exception as e:
+                print(f"Lỗi khi đọc phản hồi xác minh: {str(e)}")
+            if valid_count > total_nodes / 2:
+                print(f"Đã đạt đồng thuận sớm: {valid_count}/{total_nodes}, còn {remaining} node chưa trả lời")
+                break
+            if valid_count + remaining <= total_nodes / 2:
+                print(f"Không thể đạt đồng thuận: {valid_count}/{total_nodes}, còn {remaining} node chưa trả lời")
+                break
+        return valid_count, responded
+
+    def _when_all_done(self, futures, callback):
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Lỗi trong callback sau broadcast: {str(e)}")
+
+        for future in futures:
+            future.add_done_callback(done)
+
 node_registry = NodeRegistry()
\ No newline at end of file
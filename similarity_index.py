@@ -0,0 +1,126 @@
+# similarity_index.py
+import threading
+import numpy as np
+from blockchain import get_transaction_document_hash, get_transaction_content_hash, get_transaction_content_hash_version
+from document_analysis import decode_content_hash
+
+NUM_PERM = 128
+SIMILARITY_THRESHOLD = 0.65
+# Số dòng cấp phát ban đầu cho ma trận chữ ký, tăng gấp đôi khi đầy
+INITIAL_CAPACITY = 1024
+
+def parse_signature(content_hash, version, num_perm=NUM_PERM):
+    """Chuyển content_hash (định dạng theo version) thành mảng uint64, trả về None nếu không hợp lệ."""
+    return decode_content_hash(content_hash, version, num_perm)
+
+class ContentSimilarityIndex:
+    """Ma trận uint64 liên tục chứa chữ ký MinHash của mọi content_hash đã lưu.
+
+    Mỗi truy vấn so sánh chữ ký mới với toàn bộ các dòng bằng một phép so sánh vector hóa,
+    ước lượng Jaccard = tỉ lệ vị trí bằng nhau (giống MinHash.jaccard).
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, num_perm=NUM_PERM, initial_capacity=INITIAL_CAPACITY):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.initial_capacity = initial_capacity
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.signatures = np.empty((self.initial_capacity, self.num_perm), dtype=np.uint64)
+        self.size = 0
+        # dòng i của ma trận <-> entries[i] = (document_hash, content_hash), khóa của dòng là keys[i]
+        self.entries = []
+        self.keys = []
+        self.rows = {}
+
+    def _append_row(self, signature):
+        if self.size == len(self.signatures):
+            grown = np.empty((len(self.signatures) * 2, self.num_perm), dtype=np.uint64)
+            grown[:self.size] = self.signatures[:self.size]
+            self.signatures = grown
+        self.signatures[self.size] = signature
+        self.size += 1
+
+    def _add_transaction(self, block, position, transaction):
+        content_hash = get_transaction_content_hash(transaction)
+        signature = parse_signature(content_hash, get_transaction_content_hash_version(transaction), self.num_perm)
+        if signature is None:
+            return
+        document_hash = get_transaction_document_hash(transaction)
+        key = document_hash or f"{block['index']}:{position}"
+        if key in self.rows:
+            return
+        self.rows[key] = self.size
+        self.entries.append((document_hash, content_hash))
+        self.keys.append(key)
+        self._append_row(signature)
+
+    def _remove_row(self, key):
+        # Chuyển dòng cuối vào chỗ trống để ma trận vẫn liên tục
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            self.signatures[row] = self.signatures[last]
+            self.entries[row] = self.entries[last]
+            self.keys[row] = self.keys[last]
+            self.rows[self.keys[row]] = row
+        self.entries.pop()
+        self.keys.pop()
+        self.size -= 1
+
+    def on_block_added(self, block):
+        with self.lock:
+            for position, transaction in enumerate(block.get('transactions', [])):
+                self._add_transaction(block, position, transaction)
+
+    def on_transaction_added(self, transaction):
+        # Giao dịch đang chờ cũng được đưa vào chỉ mục để chặn tài liệu gần giống trong cùng đợt đào
+        with self.lock:
+            self._add_transaction({'index': 'pending'}, self.size, transaction)
+
+    def on_transaction_expired(self, transaction):
+        # Giao dịch từ peer không bao giờ được đào thì không được chặn tài liệu gần giống nữa
+        document_hash = get_transaction_document_hash(transaction)
+        if document_hash:
+            with self.lock:
+                self._remove_row(document_hash)
+
+    def on_chain_replaced(self, chain):
+        with self.lock:
+            self._reset()
+            for block in chain:
+                for position, transaction in enumerate(block.get('transactions', [])):
+                    self._add_transaction(block, position, transaction)
+        print(f"Đã xây lại ma trận chữ ký: {self.size} content_hash")
+
+    def __len__(self):
+        return self.size
+
+    def top_k(self, content_hash, version, k=5, threshold=None):
+        """Trả về tối đa k tài liệu giống nhất (đạt ngưỡng), dạng [(document_hash, content_hash, similarity)] giảm dần."""
+        threshold = self.threshold if threshold is None else threshold
+        signature = parse_signature(content_hash, version, self.num_perm)
+        if signature is None:
+            print("Cảnh báo: content_hash không hợp lệ, bỏ qua truy vấn độ giống")
+            return []
+        with self.lock:
+            size = self.size
+            if size == 0:
+                return []
+            scores = np.count_nonzero(self.signatures[:size] == signature, axis=1) / self.num_perm
+            entries = self.entries[:size]
+        candidates = np.flatnonzero(scores >= threshold)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        candidates = candidates[np.argsort(scores[candidates])[::-1]]
+        print(f"Truy vấn độ giống: {len(candidates)} kết quả / {size} tài liệu")
+        return [(entries[i][0], entries[i][1], float(scores[i])) for i in candidates]
+
+    def find_similar(self, content_hash, version):
+        """Tìm tài liệu giống nhất vượt ngưỡng, trả về (document_hash, content_hash, similarity) hoặc None."""
+        matches = self.top_k(content_hash, version, k=1)
+        return matches[0] if matches else None
@@ -0,0 +1,79 @@
+# test_blockchain.py
+# Kiểm tra is_chain_valid dùng lại phần đầu trùng với chuỗi cục bộ mà không nhận block bị sửa.
+# Chạy: python -m pytest test_blockchain.py
+import json
+from blockchain import Blockchain
+from chain_validation import ChainValidator
+from miner import ProofOfWorkMiner, is_proof_valid
+
+DIFFICULTY = 2
+
+class RecordingValidator(ChainValidator):
+    """Ghi lại số block được đưa vào mỗi lần kiểm tra."""
+
+    def __init__(self):
+        super().__init__(workers=1)
+        self.checked = []
+
+    def validate(self, blocks, difficulty, anchor_hash=None, check_index=False):
+        self.checked.append(len(blocks))
+        return super().validate(blocks, difficulty, anchor_hash, check_index)
+
+def new_blockchain(validator=None):
+    return Blockchain(miner=ProofOfWorkMiner(workers=1), difficulty=DIFFICULTY, validator=validator)
+
+def mine(blockchain, count):
+    for i in range(count):
+        blockchain.add_transaction({'document_hash': f'{blockchain.chain[-1]["index"]:064x}'})
+        previous_block = blockchain.get_previous_block()
+        blockchain.create_block(blockchain.proof_of_work(previous_block['proof']), previous_block=previous_block)
+
+def received(chain):
+    # Chuỗi nhận qua mạng là bản sao JSON, không dùng chung object với chuỗi cục bộ
+    return json.loads(json.dumps(chain))
+
+def local_copy_of(peer, length):
+    validator = RecordingValidator()
+    local = new_blockchain(validator)
+    local.set_chain(received(peer.chain[:length]))
+    return local, validator
+
+def test_longer_chain_only_checks_new_blocks():
+    peer = new_blockchain()
+    mine(peer, 6)
+    local, validator = local_copy_of(peer, 4)
+
+    hashes = []
+    assert local.is_chain_valid(received(peer.chain), hashes)
+    # Block neo (block cuối của phần trùng) + 3 block mới
+    assert validator.checked == [4]
+    assert hashes == [peer.hash_block(block) for block in peer.chain]
+
+def test_tampered_block_inside_prefix_is_rejected():
+    peer = new_blockchain()
+    mine(peer, 6)
+    local, validator = local_copy_of(peer, 4)
+
+    chain = received(peer.chain)
+    chain[1]['transactions'][0]['document_hash'] = 'f' * 64
+    # Block 4 vẫn trùng hash với chuỗi cục bộ nên tìm nhị phân vẫn coi 4 block đầu là phần trùng
+    assert not local.is_chain_valid(chain)
+    assert validator.checked == []
+
+def test_tampered_block_after_prefix_is_rejected():
+    peer = new_blockchain()
+    mine(peer, 6)
+    local, _ = local_copy_of(peer, 4)
+
+    chain = received(peer.chain)
+    chain[5]['transactions'][0]['document_hash'] = 'f' * 64
+    assert not local.is_chain_valid(chain)
+
+def test_valid_proof_matches_miner_without_printing(capsys):
+    blockchain = new_blockchain()
+    mine(blockchain, 1)
+    previous_proof = blockchain.chain[0]['proof']
+    capsys.readouterr()
+    for proof in range(blockchain.chain[1]['proof'] + 50):
+        assert blockchain.is_valid_proof(proof, previous_proof) == is_proof_valid(proof, previous_proof, DIFFICULTY)
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,100 @@
+# test_merkle.py
+# Kiểm tra merkle.py khớp với verifyDocumentProof trong DocumentStorage.sol / DocumentStorageV2.sol.
+# Chạy: python -m pytest test_merkle.py
+import hashlib
+import os
+import pytest
+from eth_abi.packed import encode_packed
+from merkle import MerkleTree, leaf_from_hex, verify_document_proof, verify_proof
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTRACTS = ["DocumentStorage.sol", "DocumentStorageV2.sol"]
+
+# Các biểu thức băm trong verifyDocumentProof, được mô phỏng bởi contract_verify_document_proof bên dưới
+CONTRACT_EXPRESSIONS = [
+    "bytes32 computed = sha256(abi.encodePacked(bytes1(0x00), documentHash));",
+    "? sha256(abi.encodePacked(bytes1(0x01), computed, sibling))",
+    ": sha256(abi.encodePacked(bytes1(0x01), sibling, computed));",
+]
+
+def contract_verify_document_proof(document_hash, proof, merkle_root):
+    """Dịch từng dòng verifyDocumentProof của contract sang Python (abi.encodePacked -> encode_packed)."""
+    computed = hashlib.sha256(encode_packed(['bytes1', 'bytes32'], [b'\x00', document_hash])).digest()
+    for sibling in proof:
+        if computed <= sibling:
+            computed = hashlib.sha256(encode_packed(['bytes1', 'bytes32', 'bytes32'], [b'\x01', computed, sibling])).digest()
+        else:
+            computed = hashlib.sha256(encode_packed(['bytes1', 'bytes32', 'bytes32'], [b'\x01', sibling, computed])).digest()
+    return computed == merkle_root
+
+def document_hashes(count):
+    return [hashlib.sha256(f'tài liệu {i}'.encode()).hexdigest() for i in range(count)]
+
+@pytest.mark.parametrize('source', CONTRACTS)
+def test_contract_uses_same_hashing(source):
+    with open(os.path.join(BASE_DIR, source), encoding='utf-8') as f:
+        code = f.read()
+    for expression in CONTRACT_EXPRESSIONS:
+        assert expression in code
+
+@pytest.mark.parametrize('count', [1, 2, 3, 4, 5, 7, 8, 13, 16, 17])
+def test_every_proof_matches_contract(count):
+    hashes = document_hashes(count)
+    tree = MerkleTree([leaf_from_hex(h) for h in hashes])
+    for position, document_hash in enumerate(hashes):
+        proof = tree.proof(position)
+        assert verify_document_proof(document_hash, proof, tree.root)
+        assert contract_verify_document_proof(bytes.fromhex(document_hash), proof, tree.root)
+
+def test_wrong_document_is_rejected():
+    hashes = document_hashes(8)
+    tree = MerkleTree([leaf_from_hex(h) for h in hashes])
+    other = hashlib.sha256('khác'.encode()).hexdigest()
+    assert not verify_document_proof(other, tree.proof(0), tree.root)
+    assert not contract_verify_document_proof(bytes.fromhex(other), tree.proof(0), tree.root)
+
+def test_internal_node_cannot_be_passed_off_as_document():
+    # Tài liệu 64 byte ghép từ hai lá đã sắp xếp: trước khi tách tiền tố, SHA-256 của nó chính là node cha
+    hashes = document_hashes(4)
+    tree = MerkleTree([leaf_from_hex(h) for h in hashes])
+    left, right = sorted(tree.levels[0][:2])
+    forged = hashlib.sha256(left + right).digest()
+    sibling = tree.levels[1][1]
+    assert not verify_proof(forged, [sibling], tree.root)
+    assert not verify_document_proof(forged.hex(), [sibling], tree.root)
+    assert not contract_verify_document_proof(forged, [sibling], tree.root)
+    # Gửi thẳng node trong làm document_hash cũng không được
+    parent = tree.levels[1][0]
+    assert not verify_document_proof(parent.hex(), [sibling], tree.root)
+    assert not contract_verify_document_proof(parent, [sibling], tree.root)
+
+@pytest.mark.parametrize('source, name', [("DocumentStorage.sol", "DocumentStorage"),
+                                          ("DocumentStorageV2.sol", "DocumentStorageV2")])
+def test_deployed_contract_matches(source, name):
+    # Chỉ chạy khi có solc (py-solc-x) và EVM trong bộ nhớ (eth-tester); ngược lại bỏ qua
+    solcx = pytest.importorskip('solcx')
+    pytest.importorskip('eth_tester')
+    if not solcx.get_installed_solc_versions():
+        pytest.skip("Chưa cài solc, chạy compilesc.py trước")
+    from web3 import EthereumTesterProvider, Web3
+
+    compiled = solcx.compile_files([os.path.join(BASE_DIR, source)], output_values=['abi', 'bin'])
+    interface = next(value for key, value in compiled.items() if key.endswith(f":{name}"))
+    web3 = Web3(EthereumTesterProvider())
+    web3.eth.default_account = web3.eth.accounts[0]
+    tx_hash = web3.eth.contract(abi=interface['abi'], bytecode=interface['bin']).constructor().transact()
+    address = web3.eth.wait_for_transaction_receipt(tx_hash).contractAddress
+    contract = web3.eth.contract(address=address, abi=interface['abi'])
+
+    hashes = document_hashes(5)
+    tree = MerkleTree([leaf_from_hex(h) for h in hashes])
+    web3.eth.wait_for_transaction_receipt(
+        contract.functions.storeMerkleRoot(tree.root, len(hashes)).transact()
+    )
+    for position, document_hash in enumerate(hashes):
+        assert contract.functions.verifyDocumentProof(
+            bytes.fromhex(document_hash), tree.proof(position), tree.root
+        ).call()
+    left, right = sorted(tree.levels[0][:2])
+    forged = hashlib.sha256(left + right).digest()
+    assert not contract.functions.verifyDocumentProof(forged, [tree.levels[1][1]], tree.root).call()
@@ -0,0 +1,49 @@
+# test_store_document.py
+# Kiểm tra /store_document của app_update_similar_hash.py bằng Flask test client, không cần peer hay Ethereum.
+# Chạy: python -m pytest test_store_document.py
+import importlib
+import io
+import os
+import pytest
+import p2p
+
+@pytest.fixture(scope='module')
+def node(tmp_path_factory):
+    # App tạo chain_data/ và Uploads/ theo đường dẫn tương đối, nên chạy trong thư mục tạm
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('node'))
+    discover_peers = p2p.NodeRegistry.discover_peers
+    p2p.NodeRegistry.discover_peers = lambda self: None
+    try:
+        app = importlib.import_module('app_update_similar_hash')
+        app.node_registry.peers.clear()
+        yield app
+    finally:
+        p2p.NodeRegistry.discover_peers = discover_peers
+        os.chdir(cwd)
+
+def upload(client, content, filename):
+    return client.post('/store_document', data={'file': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
+
+def test_near_duplicate_rejected_before_first_block(node):
+    # Producer chờ lâu để cả hai tài liệu đều tới khi chuỗi mới chỉ có genesis block
+    node.block_producer.max_wait = 60
+    node.block_producer.start()
+    try:
+        client = node.app.test_client()
+        text = ' '.join(f'word{i}' for i in range(400)).encode()
+
+        first = upload(client, text, 'a.txt')
+        assert first.status_code == 202
+        second = upload(client, text + b' extra words', 'b.txt')
+        assert second.status_code == 400
+
+        assert len(node.blockchain.chain) == 1
+        assert len(node.blockchain.transactions) == 1
+        pending = node.blockchain.transactions[0]['document_hash']
+        assert pending['document_hash'] == first.get_json()['file_hash']
+        # similar_hash là content_hash của tài liệu đã lưu
+        assert second.get_json()['similar_hash'] == pending['content_hash']
+    finally:
+        node.block_producer.stop()
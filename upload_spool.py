@@ -0,0 +1,39 @@
+# upload_spool.py
+import hashlib
+import os
+import tempfile
+
+class UploadSpool:
+    """File tải lên được ghi ra đĩa theo từng đoạn, đồng thời tính SHA-256, để không giữ cả file trong RAM."""
+
+    def __init__(self, path, filename, document_hash, size):
+        self.path = path
+        self.filename = filename
+        self.document_hash = document_hash
+        self.size = size
+
+    @classmethod
+    def from_stream(cls, stream, filename, folder, chunk_size=1024 * 1024):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, path = tempfile.mkstemp(dir=folder, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(path)
+            raise
+        return cls(path, filename, sha256.hexdigest(), size)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Lỗi khi xóa file tạm {self.path}: {str(e)}")